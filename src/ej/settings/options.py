@@ -18,6 +18,15 @@ class EjOptions(Conf):
     EJ_ENABLE_CLUSTERS = env(True, name="{attr}")
     EJ_ENABLE_DATAVIZ = env(True, name="{attr}")
 
+    # Dramatiq broker used by the clusterization scheduler (e.g.,
+    # redis://redis:6379/0). Messages are kept in memory if not given.
+    EJ_CLUSTERS_BROKER_URL = env(None, type=str, name="{attr}")
+
+    # Directory of memory-mapped vote matrix snapshots shared by all worker
+    # processes (e.g., /app/local/snapshots). Snapshots are disabled if not
+    # given.
+    EJ_VOTE_SNAPSHOTS_DIR = env(None, type=str, name="{attr}")
+
     # TODO: remove those in the future? Maybe all personalization strings
     # should be options in Django constance with a cache fallback
     # Personalization
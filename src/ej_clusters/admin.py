@@ -23,6 +23,8 @@ class ClusterInline(admin.StackedInline):
 @admin.register(models.Clusterization)
 class ClusterizationManagerAdmin(admin.ModelAdmin):
     inlines = [ClusterInline]
+    list_display = ["conversation", "cluster_status", "modified", "update_time"]
+    readonly_fields = ["model_stats"]
     actions = ["force_clusterization", "update_clusterization"]
 
     @descr(_("Force clusterization (slow)"))
@@ -34,3 +36,8 @@ class ClusterizationManagerAdmin(admin.ModelAdmin):
     @descr(_("Update clusterization (slow)"))
     def update_clusterization(self, request, queryset):
         self.force_clusterization(request, queryset, force=False)
+
+    @descr(_("Update time (s)"))
+    def update_time(self, obj):
+        time = obj.update_time
+        return None if time is None else round(time, 2)
@@ -11,6 +11,7 @@ class EjClustersConfig(AppConfig):
     def ready(self):
         from . import rules
         from . import api
+        from . import signals  # noqa: F401
 
         self.rules = rules
         self.api = api
@@ -0,0 +1,320 @@
+"""
+Benchmark the clusterization of synthetic conversations.
+
+Conversations are created with bulk inserts from votes generated by
+:func:`synthetic_votes`, which draws the votes of all users from the profiles
+of a few opinion groups at once. Use the ``benchmarkclusters`` management
+command to run the suite and write a JSON report.
+"""
+import platform
+import time
+import tracemalloc
+from collections import defaultdict
+from logging import getLogger
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils.timezone import now
+from sidekick import import_later
+
+from ej_conversations import create_conversation
+from ej_conversations.models import Comment, Vote
+from .math import compute_cluster_affinities, kmeans
+from .models import Cluster, Stereotype, StereotypeVote
+
+np = import_later("numpy")
+pd = import_later("pandas")
+sklearn = import_later("sklearn")
+log = getLogger("ej")
+
+DEFAULT_USERS = (1_000, 10_000, 100_000)
+DEFAULT_COMMENTS = (50, 500)
+BATCH_SIZE = 10_000
+USER_BATCH_SIZE = 500
+PREFIX = "ej-benchmark"
+
+
+def synthetic_votes(labels, centers, missing=0.5, skip=0.1, seed=None):
+    """
+    Return random votes of users that belong to the given opinion groups.
+
+    Each user votes in a comment with probability 1 - missing and skips it
+    with probability ``skip``. Otherwise, it agrees with probability
+    0.5 + 0.4 * center, in which center is the position of its group in the
+    comment.
+
+    Args:
+        labels:
+            Array with the group of each user.
+        centers:
+            (groups, comments) array with values between -1 and 1.
+
+    Returns:
+        A tuple of (users, comments, choices) arrays with the row index of
+        users, the column index of comments and the choice of each vote.
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(labels)
+    n_users, n_comments = len(labels), centers.shape[1]
+
+    voted = rng.random((n_users, n_comments), dtype=np.float32) >= missing
+    users, comments = np.nonzero(voted)
+    prob = 0.5 + 0.4 * centers[labels[users], comments]
+    choices = np.where(rng.random(len(users)) < prob, 1, -1).astype(np.int8)
+    choices[rng.random(len(users)) < skip] = 0
+    return users, comments, choices
+
+
+def make_benchmark_conversation(
+    n_users, n_comments, n_clusters=3, missing=0.5, seed=0, batch_size=BATCH_SIZE
+):
+    """
+    Create a conversation with clusters, stereotypes and synthetic votes.
+
+    Users, comments and votes are created with bulk inserts, hence model
+    signals are not sent. Remove the created objects with
+    :func:`delete_benchmark_data`.
+    """
+    User = get_user_model()
+    rng = np.random.default_rng(seed)
+    tag = f"{PREFIX}-{n_users}x{n_comments}-{now().timestamp():.0f}"
+
+    author = User.objects.create_user(f"{tag}@example.com", name="Benchmark")
+    conversation = create_conversation(
+        f"Synthetic conversation with {n_users} users and {n_comments} comments",
+        tag,
+        author=author,
+    )
+    Comment.objects.bulk_create(
+        Comment(
+            conversation=conversation,
+            author=author,
+            content=f"Synthetic comment #{i}",
+            status=Comment.STATUS.approved,
+        )
+        for i in range(n_comments)
+    )
+    comments = list(conversation.comments.order_by("id"))
+
+    # Clusters and stereotypes, whose votes are the centers of each group
+    centers = rng.choice([-1.0, 0.0, 1.0], size=(n_clusters, n_comments))
+    clusterization = conversation.get_clusterization()
+    stereotype_votes = []
+    for k, center in enumerate(centers):
+        cluster = Cluster.objects.create(clusterization=clusterization, name=f"Group {k}")
+        stereotype = Stereotype.objects.create(name=f"{tag} #{k}", owner=author)
+        cluster.stereotypes.add(stereotype)
+        stereotype_votes.extend(
+            StereotypeVote(author=stereotype, comment=comment, choice=int(choice))
+            for comment, choice in zip(comments, center)
+            if choice
+        )
+    StereotypeVote.objects.bulk_create(stereotype_votes, batch_size=batch_size)
+
+    # Users and votes are inserted in batches to bound memory usage
+    labels = rng.integers(n_clusters, size=n_users)
+    for start in range(0, n_users, USER_BATCH_SIZE):
+        stop = min(start + USER_BATCH_SIZE, n_users)
+        emails = [f"{tag}-{i}@example.com" for i in range(start, stop)]
+        User.objects.bulk_create(
+            User(email=email, name=f"User {i}", password="!")
+            for i, email in enumerate(emails, start)
+        )
+        ids = dict(User.objects.filter(email__in=emails).values_list("email", "id"))
+        users = [ids[email] for email in emails]
+        rows, cols, choices = synthetic_votes(
+            labels[start:stop], centers, missing=missing, seed=rng
+        )
+        Vote.objects.bulk_create(
+            (
+                Vote(author_id=users[i], comment=comments[j], choice=int(c))
+                for i, j, c in zip(rows, cols, choices)
+            ),
+            batch_size=batch_size,
+        )
+    return conversation
+
+
+def delete_benchmark_data(conversation):
+    """
+    Delete a conversation created by :func:`make_benchmark_conversation`,
+    with its users and stereotypes.
+    """
+    User = get_user_model()
+    tag = conversation.title
+    author = conversation.author
+    conversation.delete()
+    User.objects.filter(email__startswith=f"{tag}-").delete()
+    Stereotype.objects.filter(owner=author).delete()
+    author.delete()
+
+
+def timeit(func, repeat=1):
+    """
+    Call func() the given number of times and return a dictionary with the
+    minimum and mean execution time in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "mean": sum(times) / len(times), "repeat": repeat}
+
+
+def benchmark_conversation(conversation, repeat=1, reference=False, trace_memory=False):
+    """
+    Time the main clusterization routines in the given conversation.
+
+    Clusters are found before timing the routines that read them. If
+    reference is True, also time :func:`reference_cluster_affinities`. If
+    trace_memory is True, clusters are found once more with tracemalloc
+    enabled to measure the peak memory of each stage without slowing down
+    the timed runs.
+    """
+    clusters = conversation.get_clusterization().clusters.all()
+    votes = conversation.votes.filter(comment__status=Comment.STATUS.approved)
+    result = {"n_votes": votes.count(), "timings": {}}
+    timings = result["timings"]
+
+    timings["votes_table"] = timeit(votes.votes_table, repeat)
+    find_clusters_result = []
+    timings["find_clusters"] = timeit(
+        lambda: find_clusters_result.append(clusters.find_clusters()), repeat
+    )
+    affinity_votes = clusters.votes_table("mean")
+    timings["compute_cluster_affinities"] = timeit(
+        lambda: compute_cluster_affinities(affinity_votes), repeat
+    )
+    if reference:
+        timings["reference_cluster_affinities"] = timeit(
+            lambda: reference_cluster_affinities(affinity_votes), repeat
+        )
+    timings["separate_comments"] = timeit(clusters.separate_comments, repeat)
+
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            find_clusters_result.append(clusters.find_clusters())
+        finally:
+            tracemalloc.stop()
+    stats = getattr(find_clusters_result[-1], "stats", None)
+    result["stages"] = None if stats is None else stats.to_json()
+    return result
+
+
+def run_suite(
+    users=DEFAULT_USERS,
+    comments=DEFAULT_COMMENTS,
+    n_clusters=3,
+    missing=0.5,
+    repeat=1,
+    seed=0,
+    keep=False,
+    reference=False,
+    trace_memory=False,
+):
+    """
+    Run the benchmark for every combination of number of users and comments
+    and return a JSON-compatible report.
+
+    Args:
+        users:
+            Sequence with the number of users in each conversation.
+        comments:
+            Sequence with the number of comments in each conversation.
+        n_clusters:
+            Number of opinion groups in each conversation.
+        missing:
+            Probability that a user does not vote in a comment.
+        repeat:
+            Number of times each routine is executed.
+        seed:
+            Random seed used to generate votes.
+        keep:
+            If True, do not delete the synthetic conversations.
+        reference:
+            If True, also time the reference implementation of cluster
+            affinities. It is slow for large conversations.
+        trace_memory:
+            If True, measure the peak memory of each clusterization stage
+            with tracemalloc (see :class:`ej_clusters.utils.PipelineStats`).
+    """
+    report = {
+        "created": now().isoformat(),
+        "environment": {
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "sklearn": sklearn.__version__,
+        },
+        "parameters": {
+            "n_clusters": n_clusters,
+            "missing": missing,
+            "repeat": repeat,
+            "seed": seed,
+            "reference": reference,
+            "trace_memory": trace_memory,
+        },
+        "results": [],
+    }
+
+    for n_users in users:
+        for n_comments in comments:
+            log.info(f"[clusters] benchmark: {n_users} users, {n_comments} comments")
+            start = time.perf_counter()
+            conversation = make_benchmark_conversation(
+                n_users, n_comments, n_clusters, missing=missing, seed=seed
+            )
+            setup_time = time.perf_counter() - start
+            try:
+                result = benchmark_conversation(
+                    conversation, repeat, reference, trace_memory
+                )
+            finally:
+                if not keep:
+                    delete_benchmark_data(conversation)
+            report["results"].append(
+                {
+                    "n_users": n_users,
+                    "n_comments": n_comments,
+                    "setup_time": setup_time,
+                    **result,
+                }
+            )
+    return report
+
+
+def reference_cluster_affinities(votes):
+    """
+    Original per-user implementation of :func:`compute_cluster_affinities`.
+
+    It is kept as a reference for tests and for timing the vectorized
+    implementation with ``benchmarkclusters --reference``.
+    """
+    votes = votes.copy()
+    labels = votes["cluster"].copy()
+    votes = (votes - votes.mean()) / (votes.std() + 1e-6)
+    votes["cluster"] = labels
+
+    centroids = votes.groupby("cluster").mean()
+    clusters = votes.pop("cluster")
+    shapes = defaultdict(lambda: {"intersections": defaultdict(float), "size": 0})
+
+    for k, x in zip(clusters.values, votes.values):
+        centroid_k = centroids.loc[k].values
+        coords = x - centroid_k
+        distance_k = kmeans.l1_distance(x, centroid_k)
+        shape = shapes[int(k)]
+
+        for k_, centroid_k_ in enumerate((centroids - centroid_k).values):
+            k_ = int(centroids.index[k_])
+            if k == k_:
+                shape["size"] += 1
+            elif np.sum(coords * centroid_k_) > 0:
+                distance_k_ = kmeans.l1_distance(coords, centroid_k_)
+                shape["intersections"][k_] += distance_k / (distance_k_ + 1e-12) / 2
+
+    return dict(shapes)
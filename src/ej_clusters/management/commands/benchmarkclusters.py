@@ -0,0 +1,99 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from ...benchmark import DEFAULT_COMMENTS, DEFAULT_USERS, run_suite
+
+
+class Command(BaseCommand):
+    help = "Benchmark the clusterization of synthetic conversations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users",
+            type=int,
+            nargs="+",
+            default=list(DEFAULT_USERS),
+            help="Number of users of each synthetic conversation",
+        )
+        parser.add_argument(
+            "--comments",
+            type=int,
+            nargs="+",
+            default=list(DEFAULT_COMMENTS),
+            help="Number of comments of each synthetic conversation",
+        )
+        parser.add_argument(
+            "--clusters", type=int, default=3, help="Number of opinion groups"
+        )
+        parser.add_argument(
+            "--missing",
+            type=float,
+            default=0.5,
+            help="Probability that a user does not vote in a comment",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=1, help="Number of runs of each routine"
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed")
+        parser.add_argument(
+            "--output", "-o", help="Path of the JSON report (defaults to stdout)"
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Do not delete the synthetic conversations",
+        )
+        parser.add_argument(
+            "--reference",
+            action="store_true",
+            help="Also time the reference implementation of cluster affinities",
+        )
+        parser.add_argument(
+            "--trace-memory",
+            action="store_true",
+            help="Measure the peak memory of each clusterization stage",
+        )
+
+    def handle(
+        self,
+        *args,
+        users=DEFAULT_USERS,
+        comments=DEFAULT_COMMENTS,
+        clusters=3,
+        missing=0.5,
+        repeat=1,
+        seed=0,
+        output=None,
+        keep=False,
+        reference=False,
+        trace_memory=False,
+        **options,
+    ):
+        report = run_suite(
+            users=users,
+            comments=comments,
+            n_clusters=clusters,
+            missing=missing,
+            repeat=repeat,
+            seed=seed,
+            keep=keep,
+            reference=reference,
+            trace_memory=trace_memory,
+        )
+        data = json.dumps(report, indent=2)
+        if output is None:
+            self.stdout.write(data)
+            return
+
+        with open(output, "w") as fd:
+            fd.write(data)
+        for result in report["results"]:
+            timings = ", ".join(
+                f"{name}: {timing['min']:.3f}s"
+                for name, timing in result["timings"].items()
+            )
+            self.stdout.write(
+                f"{result['n_users']} users x {result['n_comments']} comments: {timings}"
+            )
+        self.stdout.write(f"Report saved to {output}")
@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import scheduler
+from ...utils import cache_stats
+
+
+class Command(BaseCommand):
+    help = "Send pending clusterization updates to the background workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit", type=int, help="Maximum number of updates sent in each round"
+        )
+        parser.add_argument(
+            "--loop", action="store_true", help="Keep scheduling updates periodically"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=60.0,
+            help="Interval between rounds in seconds (used with --loop)",
+        )
+        parser.add_argument(
+            "--stub",
+            action="store_true",
+            help="Use an in-memory broker and process updates in this process",
+        )
+        parser.add_argument(
+            "--stats",
+            action="store_true",
+            help="Show hit/miss counters of the clusterization cache and exit",
+        )
+        parser.add_argument(
+            "--sync",
+            action="store_true",
+            help="Run updates directly in this process, without dramatiq",
+        )
+
+    def handle(
+        self,
+        *args,
+        limit=None,
+        loop=False,
+        interval=60.0,
+        stub=False,
+        stats=False,
+        sync=False,
+        **options,
+    ):
+        if stats:
+            counts = cache_stats("find_clusters")
+            self.stdout.write(
+                f"find_clusters: {counts['hits']} hits, {counts['misses']} misses"
+            )
+            return
+
+        send, process = scheduler.update, None
+        if not sync:
+            from ... import tasks
+
+            if not (stub or tasks.broker_url()):
+                raise CommandError(
+                    "EJ_CLUSTERS_BROKER_URL is not set: use --stub or --sync to "
+                    "process updates in this process"
+                )
+            send = tasks.update_clusterization.send
+            if stub:
+                tasks.use_stub_broker()
+                process = tasks.run_worker
+
+        while True:
+            ids = scheduler.dispatch(limit=limit, send=send)
+            if ids and process is not None:
+                process()
+            if ids:
+                self.stdout.write(f"Scheduled {len(ids)} clusterization update(s)")
+            if not loop:
+                break
+            time.sleep(interval)
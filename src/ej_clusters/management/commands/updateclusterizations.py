@@ -0,0 +1,89 @@
+from boogie import rules
+from django.core.management.base import BaseCommand
+
+from ... import scheduler
+from ...enums import ClusterStatus
+from ...models import Clusterization
+
+
+class Command(BaseCommand):
+    help = "Update clusterizations of all conversations in a pool of processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Update all enabled clusterizations, even if they are up to date",
+        )
+        parser.add_argument(
+            "--jobs",
+            "-j",
+            type=int,
+            default=1,
+            help="Number of worker processes (use -1 for one process per CPU)",
+        )
+        parser.add_argument(
+            "--timeout", type=float, help="Maximum duration of each update in seconds"
+        )
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Do not warm-start k-means from the stored models",
+        )
+
+    def handle(self, *args, all=False, jobs=1, timeout=None, cold=False, **options):
+        clusterizations = Clusterization.objects.exclude(
+            cluster_status=ClusterStatus.DISABLED
+        ).select_related("conversation")
+        if not all:
+            rule = "ej.must_update_clusterization"
+            clusterizations = [c for c in clusterizations if rules.test_rule(rule, c)]
+        names = {c.id: str(c.conversation) for c in clusterizations}
+        if not names:
+            self.stdout.write("No clusterizations to update")
+            return
+
+        n_total = len(names)
+        self.stdout.write(f"Updating {n_total} clusterization(s)")
+
+        def progress(result):
+            n_done = len(results) + 1
+            name = names[result["id"]]
+            if result["error"]:
+                msg = self.style.ERROR(f"failed: {result['error']}")
+            elif result["updated"]:
+                msg = f"updated in {result['duration']:.2f}s"
+            else:
+                msg = f"unchanged ({result['duration']:.2f}s)"
+            self.stdout.write(f"[{n_done}/{n_total}] {name}: {msg}")
+            results.append(result)
+
+        results = []
+        scheduler.update_many(
+            list(names),
+            n_jobs=jobs,
+            timeout=timeout,
+            warm_start=not cold,
+            callback=progress,
+        )
+        self.write_summary(results, names)
+
+    def write_summary(self, results, names):
+        failures = [r for r in results if r["error"]]
+        durations = [r["duration"] for r in results if r["duration"] is not None]
+        n_updated = sum(r["updated"] for r in results)
+
+        self.stdout.write(
+            f"{len(results)} clusterization(s): {n_updated} updated, "
+            f"{len(results) - n_updated - len(failures)} unchanged, "
+            f"{len(failures)} failed"
+        )
+        if durations:
+            self.stdout.write(
+                f"Durations: total {sum(durations):.2f}s, "
+                f"mean {sum(durations) / len(durations):.2f}s, "
+                f"max {max(durations):.2f}s"
+            )
+        for result in failures:
+            name = names[result["id"]]
+            self.stdout.write(self.style.ERROR(f"  {name}: {result['error']}"))
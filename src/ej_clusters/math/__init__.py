@@ -1,4 +1,5 @@
 from . import kmeans
 from . import pipeline
 from .data import summarize_affinities, compute_cluster_affinities
-from .pipeline import clusterization_pipeline
+from .pipeline import clusterization_pipeline, fit_predict_stages
+from .model import ClusterModel
@@ -1,23 +1,30 @@
 import logging
+import warnings
 from collections import defaultdict, Counter
 
 from sidekick import import_later
 
+from .kmeans import compute_distance_matrix, normalize_distance
+
 log = logging.getLogger("ej")
 np = import_later("numpy")
+pd = import_later("pandas")
 models = import_later("..models", package=__name__)
 
 
 #
 # Cluster belonging fractions
 #
-def compute_cluster_affinities(votes, distance=lambda x, y: np.sum(np.abs(x - y))):
+def compute_cluster_affinities(votes, distance="l1"):
     """
     Returns a dictionary mapping clusters to a list of affinities.
 
     Each affinity is another dictionary mapping clusters to the degree of
     affinity for the user in each other cluster.
 
+    Votes are standardized in a single copy that keeps the precision of the
+    input: float32 and integer (e.g., int8) votes are processed as float32.
+
     Args:
         votes (dataframe):
             A votes dataframe with users as rows and comments as columns. It
@@ -25,37 +32,60 @@ def compute_cluster_affinities(votes, distance=lambda x, y: np.sum(np.abs(x - y)
             cluster each user is classified.
 
             Usually this data will come from a call to ``clusterization.clusters.votes_table()``
-        distance (callable):
-            Distance function.
+        distance (str or callable):
+            Distance function or the name of a distance in
+            :data:`ej_clusters.math.kmeans.DISTANCE_MAP`. Distances are
+            computed for all users at once, hence custom callables are much
+            slower than the built-in ones.
     """
-    votes = votes.copy()
-    labels = votes["cluster"].copy()
-    votes = (votes - votes.mean()) / (votes.std() + 1e-6)
-    votes["cluster"] = labels
-
-    centroids = votes.groupby("cluster").mean()
-    clusters = votes.pop("cluster")
+    clusters = votes["cluster"]
+    votes = votes.drop(columns="cluster")
+    dtype = np.result_type(np.float32, *votes.dtypes)
+    data = votes.to_numpy(dtype=dtype, copy=True)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(data, axis=0)
+        std = np.nanstd(data, axis=0, ddof=1)
+    data -= mean
+    data /= std + 1e-6
+
+    centroids = pd.DataFrame(data).groupby(clusters.values).mean()
 
     tol = 1e-12
-    shapes = defaultdict(lambda: {"intersections": defaultdict(float), "size": 0})
-
-    for k, x in zip(clusters.values, votes.values):
-        centroid_k = centroids.loc[k].values
-        coords = x - centroid_k
-        distance_k = distance(x, centroid_k)
-        shape = shapes[int(k)]
-
-        for k_, centroid_k_ in enumerate((centroids - centroid_k).values):
-            k_ = int(centroids.index[k_])
-
-            # Check if vectors point to the same direction
-            if k == k_:
-                shape["size"] += 1
-            elif np.sum(coords * centroid_k_) > 0:
-                distance_k_ = distance(coords, centroid_k_)
-                shape["intersections"][k_] += distance_k / (distance_k_ + tol) / 2
-
-    return dict(shapes)
+    centers = centroids.values
+    cluster_ids = [int(k) for k in centroids.index]
+    rows = np.arange(len(data))
+    label_idx = centroids.index.get_indexer(clusters.values)
+
+    # Distance of each user to each centroid. The distance between the
+    # displacement from the user's centroid and the displacement between
+    # centroids is the distance to the other centroid.
+    distances = compute_distance_matrix(data, centers, normalize_distance(distance))
+    own_distances = distances[rows, label_idx]
+    ratios = own_distances[:, None] / (distances + tol) / 2
+
+    # Check if vectors point to the same direction
+    own_centers = centers[label_idx]
+    coords = data - own_centers
+    dots = coords @ centers.T - np.sum(coords * own_centers, axis=1)[:, None]
+    mask = dots > 0
+    mask[rows, label_idx] = False
+
+    # Aggregate users by cluster with an indicator matrix
+    indicator = np.zeros((len(centers), len(data)))
+    indicator[label_idx, rows] = 1
+    sizes = indicator.sum(axis=1)
+    totals = indicator @ np.where(mask, ratios, 0.0)
+    present = indicator @ mask > 0
+
+    shapes = {}
+    for k in clusters.unique():
+        i = centroids.index.get_loc(k)
+        intersections = defaultdict(float)
+        for j in np.flatnonzero(present[i]):
+            intersections[cluster_ids[j]] = float(totals[i, j])
+        shapes[int(k)] = {"intersections": intersections, "size": int(sizes[i])}
+    return shapes
 
 
 def summarize_affinities(affinities):
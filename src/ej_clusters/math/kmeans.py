@@ -5,14 +5,23 @@ This module has no dependency on EJ and will stay here for a while.
 Once the API stabilizes, it will be implemented in Cython and will move to an
 external package.
 """
-import random
+import itertools
+import os
+from concurrent import futures
 
 from sidekick import import_later
 
 np = import_later("numpy")
+sparse = import_later("scipy.sparse")
+
+MINIBATCH_SIZE = 1024
+EXECUTORS = {
+    "thread": futures.ThreadPoolExecutor,
+    "process": futures.ProcessPoolExecutor,
+}
 
 
-def kmeans(data, k, n_runs=10, **kwargs):
+def kmeans(data, k, n_runs=10, n_jobs=1, backend="thread", patience=None, **kwargs):
     """
     Run kmeans n_runs times and returns the (labels, centroids) for the best
     result.
@@ -20,31 +29,156 @@ def kmeans(data, k, n_runs=10, **kwargs):
     Args:
         data: 2D input data of (samples, features)
         k (int): number of returning clusters
-        n_runs (int): number of parallel runs
+        n_runs (int): number of restarts
+        n_jobs (int): number of restarts executed concurrently (see :func:`worker`)
+        backend (str): either 'thread' or 'process' (see :func:`worker`)
+        patience (int): stop restarts early once the objective plateaus (see
+            :func:`worker`)
 
     Return:
         labels: an 1D array of labels for each data point
         centroids: [k, features] array for each centroid
 
     See also:
-        It accepts all keyword arguments of the :func:`kmeans_single` function.
+        It accepts all keyword arguments of the :func:`kmeans_run` function.
     """
-    distance = kwargs.get("distance")
-    objective = lambda x: vq(data, *x, distance=distance)
-    return worker(n_runs, objective, kmeans_run, data, k, **kwargs)
+    data = np.asarray(data)
+    objective = lambda x: -vq(data, x[0], x[1], distances=x[2])
+    labels, centroids, _ = worker(
+        n_runs,
+        objective,
+        kmeans_run,
+        data,
+        k,
+        n_jobs=n_jobs,
+        backend=backend,
+        patience=patience,
+        return_distances=True,
+        **kwargs,
+    )
+    return labels, centroids
 
 
-def worker(nruns, objective, func, *args, **kwargs):
+def worker(
+    nruns,
+    objective,
+    func,
+    *args,
+    n_jobs=1,
+    backend="thread",
+    patience=None,
+    tol=1e-6,
+    **kwargs,
+):
     """
     Worker function: runs func(*args, **kwargs) nruns times and return the
     result with the largest value for the objective function.
+
+    Args:
+        n_jobs (int):
+            Number of runs executed concurrently. If None or -1, uses one job
+            per CPU. The default (n_jobs=1) executes all runs sequentially in
+            the current thread.
+        backend ({'thread', 'process'}):
+            Pool used to execute concurrent runs. Numpy releases the GIL in
+            most array operations, hence threads are usually enough. The
+            process backend requires func and its arguments to be picklable.
+        patience (int):
+            If given, stop after this many consecutive runs fail to improve the
+            best objective value by more than a relative tolerance of tol.
+        tol (float):
+            Relative tolerance used by patience.
     """
-    # Use threads in the future?
-    results = [func(*args, **kwargs) for _ in range(nruns)]
-    return max(results, key=objective)
+    if n_jobs is None or n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = max(1, min(n_jobs, nruns))
+    best = _BestResult(objective, patience, tol)
+
+    if n_jobs == 1:
+        for _ in range(nruns):
+            if best.update(func(*args, **kwargs)):
+                break
+        return best.result
+
+    try:
+        executor_class = EXECUTORS[backend]
+    except KeyError:
+        raise ValueError(f"invalid backend: {backend}")
 
+    # Each process must receive its own random seed, otherwise forked workers
+    # would share the same random state and repeat the same run.
+    if backend == "process":
+        seeds = iter(np.random.randint(0, 2**31 - 1, size=nruns))
+    else:
+        seeds = itertools.repeat(None)
+    with executor_class(n_jobs) as executor:
+        submit = lambda: executor.submit(_seeded_call, next(seeds), func, args, kwargs)
+        pending = {submit() for _ in range(n_jobs)}
+        n_submitted = n_jobs
+        stop = False
+
+        while pending:
+            done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                stop = best.update(future.result()) or stop
+            if stop:
+                for future in pending:
+                    future.cancel()
+                break
+            while n_submitted < nruns and len(pending) < n_jobs:
+                pending.add(submit())
+                n_submitted += 1
+
+    return best.result
+
+
+class _BestResult:
+    """
+    Keep track of the best result in a sequence of runs.
+    """
 
-def kmeans_stereotypes(data, stereotypes, max_iter=20, distance=None, aggregator=None):
+    def __init__(self, objective, patience=None, tol=1e-6):
+        self.objective = objective
+        self.patience = patience
+        self.tol = tol
+        self.result = None
+        self.value = None
+        self.n_stalled = 0
+
+    def update(self, result):
+        """
+        Register result and return True if runs should stop.
+        """
+        value = self.objective(result)
+        if self.value is None:
+            self.result, self.value = result, value
+            return False
+
+        if value - self.value > self.tol * abs(self.value):
+            self.n_stalled = 0
+        else:
+            self.n_stalled += 1
+        if value > self.value:
+            self.result, self.value = result, value
+        return self.patience is not None and self.n_stalled >= self.patience
+
+
+def _seeded_call(seed, func, args, kwargs):
+    if seed is not None:
+        np.random.seed(seed)
+    return func(*args, **kwargs)
+
+
+def kmeans_stereotypes(
+    data,
+    stereotypes,
+    max_iter=20,
+    distance=None,
+    aggregator=None,
+    init_centroids=None,
+    init_labels=None,
+    return_n_iter=False,
+):
     """
     Implements k-means clustering with defined stereotypes.
 
@@ -56,35 +190,225 @@ def kmeans_stereotypes(data, stereotypes, max_iter=20, distance=None, aggregator
       multiple parallel runs of the algorithm.
 
     Args:
-        data: input data of (samples, features)
+        data: input data of (samples, features). It can be a dense array or a
+            scipy sparse matrix.
         stereotypes: average feature set for each stereotype (k, features)
         max_iter: maximum number of iterations
         distance: distance function (defaults to 'euclidean')
         aggregator: aggregator function used (defaults to 'mean')
+        init_centroids: initial (k, features) centroids. Defaults to the
+            stereotypes. Use the centroids of a previous run to warm-start the
+            algorithm.
+        init_labels: initial labels for each sample. If the labels computed
+            from the initial centroids are equal to those, the algorithm
+            stops in the first iteration and centroids are recomputed from
+            the data. Use -1 for unknown labels.
+        return_n_iter: if True, also return the number of iterations.
 
     Returns:
-        Two arrays of (labels, centroids)
+        Two arrays of (labels, centroids) or a tuple (labels, centroids, n_iter)
+        if return_n_iter=True.
     """
+    stereotypes = np.asarray(stereotypes)
     k = len(stereotypes)
-    data = np.asarray(data)
-    data_ext = np.vstack([data, stereotypes])
+    data = as_array(data)
+    if sparse.issparse(data):
+        data_ext = sparse.vstack([data, masked_to_sparse(stereotypes)], format="csr")
+    else:
+        data_ext = np.vstack([data, stereotypes])
     labels_extra = np.arange(k, dtype=int)
-    stereotypes = np.asarray(stereotypes)
-    centroids = stereotypes.copy()
-    labels = np.random.randint(0, k, size=len(data))
 
-    for i in range(max_iter):
+    if init_centroids is None:
+        centroids = stereotypes.copy()
+    else:
+        centroids = np.array(init_centroids, dtype=float)
+    if init_labels is None:
+        labels = np.random.randint(0, k, size=data.shape[0])
+    else:
+        labels = np.asarray(init_labels)
+
+    n_iter = 0
+    updated = False
+    for n_iter in range(1, max_iter + 1):
         labels_ = compute_labels(data, centroids, distance)
         if (labels_ == labels).all():
-            return labels_, centroids
+            break
         labels_ext = np.append(labels_, labels_extra)
         centroids = compute_centroids(data_ext, labels_ext, k, aggregator)
         labels = labels_
+        updated = True
+
+    if n_iter and not updated:
+        # Labels were stable in the first iteration, hence centroids are still
+        # the initial ones and must be computed from the data
+        labels = labels_
+        labels_ext = np.append(labels, labels_extra)
+        centroids = compute_centroids(data_ext, labels_ext, k, aggregator)
+
+    if return_n_iter:
+        return labels, centroids, n_iter
+    return labels, centroids
+
+
+def kmeans_stereotypes_minibatch(
+    data,
+    stereotypes,
+    batch_size=MINIBATCH_SIZE,
+    max_iter=20,
+    distance=None,
+    aggregator=None,
+    init_centroids=None,
+    init_labels=None,
+    return_n_iter=False,
+):
+    """
+    Mini-batch version of :func:`kmeans_stereotypes`.
+
+    Each iteration visits all samples in random batches of batch_size rows.
+    Samples in a batch are assigned to the closest centroid, which then moves
+    towards their mean with a learning rate inversely proportional to the
+    number of samples it has seen so far. Stereotypes are added to their own
+    clusters at the end of each iteration, hence centroids remain anchored to
+    the stereotypes. After the last iteration, centroids are recomputed as the
+    means of the returned labels.
+
+    The result is an approximation of the full-batch algorithm. Counts
+    accumulate across iterations, so each centroid is a running mean that
+    still weights samples assigned to it in earlier iterations, including
+    assignments that changed since then. Results differ the most when labels
+    change after the first iterations, when batches are small compared to
+    the clusters, or when :meth:`MiniBatchStereotypeKMeans.partial_fit`
+    keeps the counts of previous chunks.
+
+    Only one batch is densified at a time. It accepts the same arguments as
+    :func:`kmeans_stereotypes`, except that the aggregator must be one of
+    'mean' or 'mean-finite'.
+
+    Returns:
+        Two arrays of (labels, centroids) or a tuple (labels, centroids, n_iter)
+        if return_n_iter=True.
+    """
+    stereotypes = np.asarray(stereotypes)
+    k = len(stereotypes)
+    data = as_array(data)
+    n_samples = data.shape[0]
+
+    if init_centroids is None:
+        centroids = np.array(stereotypes, dtype=float)
+    else:
+        centroids = np.array(init_centroids, dtype=float)
+    counts = minibatch_counts(stereotypes, aggregator)
+    if init_labels is None:
+        labels = np.full(n_samples, -1)
+    else:
+        labels = np.asarray(init_labels)
+
+    n_iter = 0
+    for n_iter in range(1, max_iter + 1):
+        labels_ = np.empty(n_samples, dtype=int)
+        order = np.random.permutation(n_samples)
+        for start in range(0, n_samples, batch_size):
+            idx = np.sort(order[start : start + batch_size])
+            labels_[idx] = minibatch_update(
+                data[idx], centroids, counts, distance, aggregator
+            )
+        minibatch_update(stereotypes, centroids, counts, aggregator=aggregator, labels=k)
+        if (labels_ == labels).all():
+            break
+        labels = labels_
+
+    # Centroids moved during the last pass, hence we recompute labels and
+    # then centroids from scratch, so they are the means of the final labels
+    labels = compute_labels(data, centroids, distance)
+    counts = minibatch_counts(stereotypes, aggregator)
+    for start in range(0, n_samples, batch_size):
+        batch = slice(start, start + batch_size)
+        minibatch_update(
+            data[batch], centroids, counts, aggregator=aggregator, labels=labels[batch]
+        )
+    minibatch_update(stereotypes, centroids, counts, aggregator=aggregator, labels=k)
+    if return_n_iter:
+        return labels, centroids, n_iter
     return labels, centroids
 
 
+def minibatch_counts(stereotypes, aggregator=None):
+    """
+    Return the zero sample counts used by :func:`minibatch_update`.
+
+    Masked aggregators count samples for each feature, ignoring missing
+    values.
+    """
+    stereotypes = np.asarray(stereotypes)
+    if _minibatch_masked(aggregator):
+        return np.zeros(stereotypes.shape)
+    return np.zeros((len(stereotypes), 1))
+
+
+def minibatch_update(
+    batch, centroids, counts, distance=None, aggregator=None, labels=None
+):
+    """
+    Assign samples in batch to the closest centroids and move each centroid
+    towards the mean of its samples.
+
+    Centroids and counts (see :func:`minibatch_counts`) are updated inplace.
+    After any number of updates, each centroid is the mean of all samples
+    assigned to it, computed by the given aggregator. Centroids that did not
+    receive any sample keep their initial values.
+
+    Args:
+        labels:
+            Labels of samples in batch. If not given, assign each sample to
+            the closest centroid. If it is an integer k, the batch must
+            have k rows, which are assigned to the corresponding centroids.
+
+    Returns:
+        Array with the label of each sample in batch.
+    """
+    masked = _minibatch_masked(aggregator)
+    k = len(centroids)
+    if labels is None:
+        labels = compute_labels(batch, centroids, distance)
+    elif isinstance(labels, int):
+        labels = np.arange(labels)
+
+    if sparse.issparse(batch):
+        batch = sparse_to_masked(batch) if masked else batch.toarray()
+    batch = _as_float(batch)
+    if masked:
+        mask = np.isfinite(batch)
+        batch = np.where(mask, batch, 0)
+        n = _dense(_indicator_matrix(labels, k) @ mask.astype(batch.dtype))
+    else:
+        n = np.bincount(labels, minlength=k)[:, None]
+
+    sums = _dense(_indicator_matrix(labels, k) @ batch)
+    counts += n
+    current = np.nan_to_num(centroids)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        updated = current + (sums - n * current) / counts
+    centroids[:] = np.where(counts > 0, updated, centroids)
+    return labels
+
+
+def _minibatch_masked(aggregator):
+    aggregator = normalize_aggregator(aggregator)
+    if aggregator is mean_aggregator:
+        return False
+    elif aggregator is mean_finite_aggregator:
+        return True
+    raise ValueError(f"mini-batch k-means does not support aggregator: {aggregator}")
+
+
 def kmeans_run(
-    data, k: int, max_iter=10, init_centroids=None, distance=None, aggregator=None
+    data,
+    k: int,
+    max_iter=10,
+    init_centroids=None,
+    distance=None,
+    aggregator=None,
+    return_distances=False,
 ):
     """
     Compute a single k-means run with at most max_iter iterations.
@@ -101,43 +425,84 @@ def kmeans_run(
         aggregator:
             aggregator function that computes clusters from samples
             (defaults to :func:`mean_aggregator`)
+        return_distances (bool):
+            If True, also return the (samples, k) matrix of distances from
+            each sample to the returned centroids, which can be passed to
+            :func:`vq`.
 
     Returns:
-        Two arrays of (labels, centroids)
+        Two arrays of (labels, centroids) or a tuple (labels, centroids,
+        distances) if return_distances=True.
     """
-    init_centroids = init_centroids or init_kmeanspp
     distance = distance or euclidean_distance
     data = np.asarray(data)
 
-    centroids = init_centroids(data, k)
+    if init_centroids is None:
+        centroids = init_kmeanspp(data, k, distance)
+    else:
+        centroids = init_centroids(data, k)
     labels = np.random.randint(0, k, size=len(data))
-    for i in range(max_iter):
-        labels_ = compute_labels(data, centroids, distance)
+    distances = None
+    updated = False
+    for _ in range(max_iter):
+        distances = compute_distance_matrix(data, centroids, distance)
+        labels_ = distances.argmin(axis=1)
         if (labels_ == labels).all():
-            return labels_, centroids
+            break
         centroids = compute_centroids(data, labels_, k, aggregator)
         labels = labels_
-    return labels, centroids
+        distances = None
+        updated = True
+
+    if max_iter and not updated:
+        # Random labels matched the initial centroids in the first iteration,
+        # hence centroids must be computed from the data
+        labels = labels_
+        centroids = compute_centroids(data, labels, k, aggregator)
+        distances = None
+
+    if not return_distances:
+        return labels, centroids
+    if distances is None:
+        # Centroids moved in the last iteration
+        distances = compute_distance_matrix(data, centroids, distance)
+    return labels, centroids, distances
 
 
-def init_kmeanspp(data, k):
+def init_kmeanspp(data, k, distance=None):
     """
-    Uses Kmeans++ strategy for initializing centroids: just pick k random
-    different points.
+    Uses Kmeans++ strategy for initializing centroids.
+
+    The first centroid is a random sample. Each following centroid is drawn
+    from the remaining samples with probability proportional to the squared
+    distance to the closest centroid selected so far.
     """
+    data = np.asarray(data)
     n = len(data)
 
-    # Pick indexes
     if k == n:
-        selected = range(n)
+        return data.copy()
     elif k > n:
-        raise ValueError(f"we need at least {n} samples in the dataset")
-    else:
-        selected = set()
-        while len(selected) < n:
-            selected.add(random.randrange(0, n))
+        raise ValueError(f"we need at least {k} samples in the dataset")
+
+    selected = [np.random.randint(n)]
+    sq_distances = _sq_distances_to(data, selected[0], distance)
+    for _ in range(1, k):
+        total = sq_distances.sum()
+        if total > 0:
+            idx = np.random.choice(n, p=sq_distances / total)
+        else:
+            # All remaining samples coincide with some selected centroid
+            idx = np.random.choice(np.setdiff1d(np.arange(n), selected))
+        selected.append(idx)
+        np.minimum(sq_distances, _sq_distances_to(data, idx, distance), out=sq_distances)
+
+    return data[selected].copy()
 
-    return np.array([data[i] for i in selected])
+
+def _sq_distances_to(data, idx, distance):
+    distances = compute_distance_matrix(data, data[idx : idx + 1], distance)[:, 0]
+    return np.nan_to_num(distances * distances, nan=0.0, posinf=0.0)
 
 
 def compute_labels(data, centroids, distance=None):
@@ -155,25 +520,59 @@ def compute_labels(data, centroids, distance=None):
     return compute_distance_matrix(data, centroids, distance).argmin(axis=1)
 
 
-def compute_distance_matrix(data, centroids, distance=None):
+def compute_distance_matrix(data, centroids, distance=None, chunk_size=None):
     """
     Return matrix of distances of each data element from each centroid.
 
+    Built-in distances (see :data:`DISTANCE_MAP`) are computed with array
+    operations over chunks of samples, so memory usage stays bounded for large
+    datasets. Custom callables fall back to a per-pair loop.
+
     Args:
         data:
-            2D input data of (samples, features)
+            2D input data of (samples, features). Sparse matrices are converted
+            to dense arrays one chunk at a time. Masked distances (see
+            :data:`MASKED_DISTANCES`) treat the entries that are not stored in
+            sparse matrices as missing values.
         centroids:
             2D array of centroids (k, features)
         distance:
             the distance function (defaults to Euclidean distance)
+        chunk_size (int):
+            number of samples processed at once. Defaults to a value that keeps
+            temporary arrays under :data:`DISTANCE_CHUNK_ELEMENTS` elements.
     """
-    data = np.asarray(data)
+    data = as_array(data)
     centroids = np.asarray(centroids)
 
     n_samples, n_features = data.shape
     k = len(centroids)
     distance = distance or euclidean_distance
     distances = np.empty([n_samples, k])
+
+    try:
+        distance_matrix = DISTANCE_MATRIX_MAP[distance]
+    except (KeyError, TypeError):
+        distance_matrix = lambda x, y: pairwise_distance_matrix(x, y, distance)
+    masked = is_masked_distance(distance)
+
+    if chunk_size is None:
+        chunk_size = max(1, DISTANCE_CHUNK_ELEMENTS // max(1, k * n_features))
+    for start in range(0, n_samples, chunk_size):
+        end = start + chunk_size
+        chunk = data[start:end]
+        if sparse.issparse(chunk):
+            chunk = sparse_to_masked(chunk) if masked else chunk.toarray()
+        distances[start:end] = distance_matrix(chunk, centroids)
+    return distances
+
+
+def pairwise_distance_matrix(data, centroids, distance):
+    """
+    Compute the distance matrix calling distance(sample, centroid) for each
+    pair of elements.
+    """
+    distances = np.empty([len(data), len(centroids)])
     for i, sample in enumerate(data):
         for j, centroid in enumerate(centroids):
             distances[i, j] = distance(sample, centroid)
@@ -184,6 +583,10 @@ def compute_centroids(data, labels, k, aggregator=None):
     """
     Compute centroids from data and labels.
 
+    Built-in aggregators (see :data:`AGGREGATOR_MATRIX_MAP`) compute all
+    centroids at once with a single product between a sparse (k, samples)
+    indicator matrix and data. Custom callables are called once per cluster.
+
     Args:
         data:
             2D input data of (samples, features)
@@ -195,9 +598,13 @@ def compute_centroids(data, labels, k, aggregator=None):
     """
     aggregator = aggregator or mean_aggregator
     labels = np.asarray(labels)
-    data = np.asarray(data)
+    data = as_array(data)
 
-    return np.array([aggregator(data[labels == k_]) for k_ in range(k)])
+    try:
+        centroids_matrix = AGGREGATOR_MATRIX_MAP[aggregator]
+    except (KeyError, TypeError):
+        return np.array([aggregator(data[labels == k_]) for k_ in range(k)])
+    return centroids_matrix(data, labels, k)
 
 
 #
@@ -233,6 +640,9 @@ def euclidean_distance_non_zero(x, y):
 def euclidean_distance_finite(x, y):
     """
     Euclidean distance between two arrays ignoring NaN components.
+
+    This is a masked distance: when used with sparse matrices, components
+    that are not stored are also ignored.
     """
     x, y = np.asarray(x), np.asarray(y)
     not_null = np.isfinite(x) & np.isfinite(y)
@@ -248,16 +658,140 @@ def l1_distance(x, y):
     return np.sum(np.abs(x - y))
 
 
+#
+# Vectorized distance matrices
+#
+# Each function receives a (n, features) and a (k, features) array and return
+# the (n, k) matrix of distances computed by the corresponding function above.
+#
+DISTANCE_CHUNK_ELEMENTS = 2**22
+
+
+def euclidean_distance_matrix(data, centroids):
+    """
+    Matrix version of :func:`euclidean_distance`.
+    """
+    data, centroids = _as_float(data), _as_float(centroids)
+    sq_data = np.einsum("ij,ij->i", data, data)[:, None]
+    sq_centroids = np.einsum("ij,ij->i", centroids, centroids)[None, :]
+    sq_distances = sq_data + sq_centroids - 2 * (data @ centroids.T)
+    return np.sqrt(np.maximum(sq_distances, 0, out=sq_distances))
+
+
+def euclidean_distance_non_zero_matrix(data, centroids):
+    """
+    Matrix version of :func:`euclidean_distance_non_zero`.
+    """
+    data, centroids = _as_float(data), _as_float(centroids)
+    data_mask = (data != 0).astype(data.dtype)
+    centroids_mask = (centroids != 0).astype(centroids.dtype)
+    sq_distances = _masked_sq_distances(data, centroids, data_mask, centroids_mask)
+    non_zero = data_mask @ centroids_mask.T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.sqrt(sq_distances / non_zero)
+
+
+def euclidean_distance_finite_matrix(data, centroids):
+    """
+    Matrix version of :func:`euclidean_distance_finite`.
+    """
+    data, centroids = _as_float(data), _as_float(centroids)
+    data_mask = np.isfinite(data)
+    centroids_mask = np.isfinite(centroids)
+    data = np.where(data_mask, data, 0)
+    centroids = np.where(centroids_mask, centroids, 0)
+    data_mask = data_mask.astype(data.dtype)
+    centroids_mask = centroids_mask.astype(centroids.dtype)
+    sq_distances = _masked_sq_distances(data, centroids, data_mask, centroids_mask)
+    return np.sqrt(sq_distances / data.shape[1])
+
+
+def l1_distance_matrix(data, centroids):
+    """
+    Matrix version of :func:`l1_distance`.
+    """
+    data, centroids = np.asarray(data), np.asarray(centroids)
+    return np.abs(data[:, None, :] - centroids[None, :, :]).sum(axis=2)
+
+
+def sparse_to_masked(data):
+    """
+    Convert sparse matrix to a dense array in which entries that are not
+    stored are NaN. Explicitly stored zeros are kept.
+    """
+    data = data.tocoo()
+    result = np.full(data.shape, np.nan, dtype=_as_float(data.data).dtype)
+    result[data.row, data.col] = data.data
+    return result
+
+
+def masked_to_sparse(data):
+    """
+    Inverse of :func:`sparse_to_masked`: return a CSR matrix that stores all
+    finite entries of data, including zeros.
+    """
+    data = np.asarray(data)
+    rows, cols = np.nonzero(np.isfinite(data))
+    values = data[rows, cols]
+    return sparse.csr_matrix((values, (rows, cols)), shape=data.shape)
+
+
+def as_array(data):
+    """
+    Convert data to a numpy array, unless it is a scipy sparse matrix.
+    """
+    if sparse.issparse(data):
+        return data
+    return np.asarray(data)
+
+
+def _as_float(data):
+    data = np.asarray(data)
+    if data.dtype.kind != "f":
+        data = data.astype(float)
+    return data
+
+
+def _masked_sq_distances(data, centroids, data_mask, centroids_mask):
+    # Expands sum(mx * mc * (x - c)**2) as matrix products. Masked entries of
+    # data and centroids must be zero.
+    sq_distances = (data * data) @ centroids_mask.T
+    sq_distances += data_mask @ (centroids * centroids).T
+    sq_distances -= 2 * (data @ centroids.T)
+    return np.maximum(sq_distances, 0, out=sq_distances)
+
+
 DISTANCE_MAP = {
     None: euclidean_distance,
     "euclidean": euclidean_distance,
     "euclidean-non-zero": euclidean_distance_non_zero,
-    "euclidiean-finite": euclidean_distance_finite,
+    "euclidean-finite": euclidean_distance_finite,
+    "euclidiean-finite": euclidean_distance_finite,  # kept for old models
     "l1": l1_distance,
     "l2": euclidean_distance,
 }
 
 
+DISTANCE_MATRIX_MAP = {
+    euclidean_distance: euclidean_distance_matrix,
+    euclidean_distance_non_zero: euclidean_distance_non_zero_matrix,
+    euclidean_distance_finite: euclidean_distance_finite_matrix,
+    l1_distance: l1_distance_matrix,
+}
+
+
+# Distances that ignore missing values, represented by NaN in dense arrays
+# and by non-stored entries in sparse matrices.
+MASKED_DISTANCES = {euclidean_distance_finite}
+
+
+def is_masked_distance(func):
+    try:
+        return func in MASKED_DISTANCES
+    except TypeError:
+        return False
+
+
 def normalize_distance(value):
     """
     Normalizes distance value to a callable from user input.
@@ -270,15 +804,31 @@ def normalize_distance(value):
         raise ValueError(f"invalid distance: {value}")
 
 
-def vq(data, labels, centroids, distance=None, transform=(lambda x: x * x)):
+def vq(
+    data,
+    labels,
+    centroids,
+    distance=None,
+    transform=(lambda x: x * x),
+    distances=None,
+):
     """
     Return the variation coefficient of data.
+
+    This is the sum of transform(d) for the distance d of each sample to the
+    centroid of its label. Transform is applied to the array of distances.
+
+    Args:
+        distances:
+            (samples, k) matrix of distances from each sample to each centroid
+            (see :func:`compute_distance_matrix`). If not given, it is
+            computed from data.
     """
-    distance = distance or euclidean_distance
-    return sum(
-        sum(transform(distance(centroid, sample)) for sample in data[labels == k])
-        for k, centroid in enumerate(centroids)
-    )
+    if distances is None:
+        distances = compute_distance_matrix(data, centroids, distance)
+    labels = np.asarray(labels)
+    sample_distances = distances[np.arange(len(labels)), labels]
+    return float(np.sum(transform(sample_distances)))
 
 
 #
@@ -288,13 +838,82 @@ def mean_aggregator(data):
     """
     Return the mean value of a cluster.
     """
-    return data.mean(axis=0)
+    return np.asarray(data.mean(axis=0)).reshape(-1)
+
+
+def mean_finite_aggregator(data):
+    """
+    Return the mean value of a cluster ignoring missing values.
+
+    Missing values are NaN in dense arrays and the non-stored entries of sparse
+    matrices. Features without any value are NaN.
+    """
+    return mean_finite_centroids_matrix(data, np.zeros(data.shape[0], dtype=int), 1)[0]
 
 
 def normalize_aggregator(value):
     if callable(value):
         return value
-    elif value in ("mean", None):
-        return mean_aggregator
-    else:
+    try:
+        return AGGREGATOR_MAP[value]
+    except KeyError:
         raise ValueError(f"invalid aggregator: {value}")
+
+
+#
+# Vectorized aggregators
+#
+# Each function receives the (n, features) data, an array of labels and the
+# number of clusters k and return the (k, features) matrix of centroids
+# computed by the corresponding aggregator above.
+#
+def mean_centroids_matrix(data, labels, k):
+    """
+    Matrix version of :func:`mean_aggregator`.
+    """
+    indicator = _indicator_matrix(labels, k)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sums = _dense(indicator @ data)
+        return sums / np.bincount(labels, minlength=k)[:, None]
+
+
+def mean_finite_centroids_matrix(data, labels, k):
+    """
+    Matrix version of :func:`mean_finite_aggregator`.
+    """
+    indicator = _indicator_matrix(labels, k)
+    if sparse.issparse(data):
+        data = sparse.csr_matrix(data)
+        mask = data.copy()
+        mask.data = np.ones_like(mask.data)
+    else:
+        data = _as_float(data)
+        mask = np.isfinite(data)
+        data = np.where(mask, data, 0)
+        mask = mask.astype(data.dtype)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return _dense(indicator @ data) / _dense(indicator @ mask)
+
+
+def _indicator_matrix(labels, k):
+    # Sparse (k, n) matrix with ones in the (label, sample) positions
+    labels = np.asarray(labels)
+    n = len(labels)
+    ones = np.ones(n)
+    return sparse.csr_matrix((ones, (labels, np.arange(n))), shape=(k, n))
+
+
+def _dense(data):
+    return data.toarray() if sparse.issparse(data) else np.asarray(data)
+
+
+AGGREGATOR_MAP = {
+    None: mean_aggregator,
+    "mean": mean_aggregator,
+    "mean-finite": mean_finite_aggregator,
+}
+
+AGGREGATOR_MATRIX_MAP = {
+    mean_aggregator: mean_centroids_matrix,
+    mean_finite_aggregator: mean_finite_centroids_matrix,
+}
@@ -5,10 +5,17 @@ from .kmeans import (
     normalize_distance,
     normalize_aggregator,
     kmeans_stereotypes,
+    kmeans_stereotypes_minibatch,
+    minibatch_counts,
+    minibatch_update,
+    MINIBATCH_SIZE,
     compute_labels,
+    sparse_to_masked,
+    is_masked_distance,
     np,
     compute_distance_matrix,
     vq,
+    sparse,
 )
 
 
@@ -26,9 +33,13 @@ class StereotypeKMeans(KMeans):
             Distance function (defaults to 'euclidean')
         aggregator (str or callable):
             Aggregator function used to form clusters (defaults to 'mean')
+
+    Use distance='euclidean-finite' and aggregator='mean-finite' to ignore
+    missing values instead of imputing them. Missing values are NaN in dense
+    arrays and the entries that are not stored in sparse matrices.
     """
 
-    _fit_parameters = ("labels_", "cluster_centers_")
+    _fit_parameters = ("labels_", "cluster_centers_", "n_iter_")
 
     # noinspection PyMissingConstructor
     def __init__(self, n_clusters=None, max_iter=20, distance=None, aggregator=None):
@@ -41,24 +52,65 @@ class StereotypeKMeans(KMeans):
         self._args = dict(max_iter=max_iter, distance=distance, aggregator=aggregator)
 
     # noinspection PyIncorrectDocstring
-    def fit(self, X, y=None, sample_weight=None):  # noqa: N803
+    def fit(
+        self,
+        X,  # noqa: N803
+        y=None,
+        sample_weight=None,
+        init_centroids=None,
+        init_labels=None,
+    ):
         """
         Compute k-means using stereotype initialization.
 
         Args:
             X (array[n_samples, n_features]):
-                New data.
+                New data. It may be a scipy sparse matrix.
             y, sample_weight (ignored):
                 not used, present here for API consistency by convention.
+            init_centroids (array[n_clusters, n_features]):
+                Centroids of a previous fit used to warm-start the algorithm
+                instead of the stereotypes.
+            init_labels (array[n_samples - n_clusters]):
+                Labels of a previous fit for the non-stereotype rows. Use -1
+                for samples that were not classified before.
         """
-        data = X[: -self.n_clusters]
-        stereotypes = X[-self.n_clusters :]
-        labels, centroids = kmeans_stereotypes(data, stereotypes, **self._args)
+        data, stereotypes = self._split_stereotypes(X)
+        labels, centroids, n_iter = self._kmeans(
+            data,
+            stereotypes,
+            init_centroids=init_centroids,
+            init_labels=init_labels,
+            return_n_iter=True,
+            **self._args,
+        )
         stereotype_labels = compute_labels(stereotypes, centroids, distance=self.distance)
         self.labels_ = np.hstack([labels, stereotype_labels])  # noqa: N803
         self.cluster_centers_ = centroids  # noqa: N803
+        self.n_iter_ = n_iter
         return self
 
+    def _kmeans(self, data, stereotypes, **kwargs):
+        return kmeans_stereotypes(data, stereotypes, **kwargs)
+
+    def _split_stereotypes(self, X):  # noqa: N803
+        # Return (data, stereotypes), with stereotypes as a dense array
+        data = X[: -self.n_clusters]
+        stereotypes = X[-self.n_clusters :]
+        if sparse.issparse(stereotypes) and is_masked_distance(self.distance):
+            stereotypes = sparse_to_masked(stereotypes)
+        elif sparse.issparse(stereotypes):
+            stereotypes = stereotypes.toarray()
+        return data, stereotypes
+
+    def fit_predict(self, X, y=None, sample_weight=None, **kwargs):  # noqa: N803
+        """
+        Compute cluster centers and predict cluster index for each sample.
+
+        It accepts the same arguments as :meth:`fit`.
+        """
+        return self.fit(X, sample_weight=sample_weight, **kwargs).labels_
+
     def _transform(self, X):  # noqa: N803
         centers = self.cluster_centers_
         return compute_distance_matrix(X, centers, distance=self.distance)
@@ -107,8 +159,95 @@ class StereotypeKMeans(KMeans):
         """
         check_is_fitted(self, "cluster_centers_")
         X = self._check_test_data(X)  # noqa: N806
-        labels = self.predict(X)
+        distances = self._transform(X)
+        labels = distances.argmin(axis=1)
         transform = (lambda x: x * x) if squared else (lambda x: x)
         return -vq(
-            X, labels, self.cluster_centers_, distance=self.distance, transform=transform
+            X, labels, self.cluster_centers_, transform=transform, distances=distances
+        )
+
+
+class MiniBatchStereotypeKMeans(StereotypeKMeans):
+    """
+    Mini-batch K-Means with stereotypes.
+
+    Like :class:`StereotypeKMeans`, but centroids are updated after each batch
+    of samples (see :func:`ej_clusters.math.kmeans.kmeans_stereotypes_minibatch`).
+    This makes each iteration cheaper in conversations with many
+    participants, at the cost of approximate centroids. It also supports
+    incremental fits with :meth:`partial_fit`.
+
+    Args:
+        batch_size (int):
+            Number of samples in each batch.
+
+    It accepts the same arguments as :class:`StereotypeKMeans`, except that
+    the aggregator must be one of 'mean' or 'mean-finite'.
+    """
+
+    _fit_parameters = (*StereotypeKMeans._fit_parameters, "counts_")
+
+    # noinspection PyMissingConstructor
+    def __init__(
+        self,
+        n_clusters=None,
+        max_iter=20,
+        distance=None,
+        aggregator=None,
+        batch_size=MINIBATCH_SIZE,
+    ):
+        super().__init__(n_clusters, max_iter, distance, aggregator)
+        self.batch_size = batch_size
+        self._args["batch_size"] = batch_size
+
+    def _kmeans(self, data, stereotypes, **kwargs):
+        return kmeans_stereotypes_minibatch(data, stereotypes, **kwargs)
+
+    def fit(self, X, *args, **kwargs):  # noqa: N803
+        # Sample counts are not kept by fit(), hence a subsequent
+        # partial_fit() moves the fitted centroids as if they were new.
+        super().fit(X, *args, **kwargs)
+        self.counts_ = None
+        return self
+
+    def partial_fit(self, X, y=None, sample_weight=None):  # noqa: N803
+        """
+        Update centroids with a single pass over the given chunk of samples.
+
+        As in :meth:`fit`, the last n_clusters rows of X are the stereotypes.
+        They initialize the centroids in the first call and are added to
+        their own clusters after each chunk, as in each iteration of
+        :meth:`fit`. Call it repeatedly with successive chunks of votes to
+        cluster datasets that do not fit in memory.
+
+        Args:
+            X (array[n_samples, n_features]):
+                New data. It may be a scipy sparse matrix.
+            y, sample_weight (ignored):
+                not used, present here for API consistency by convention.
+        """
+        data, stereotypes = self._split_stereotypes(X)
+        if getattr(self, "counts_", None) is None:
+            if getattr(self, "cluster_centers_", None) is None:
+                self.cluster_centers_ = np.array(stereotypes, dtype=float)
+            self.counts_ = minibatch_counts(stereotypes, self.aggregator)
+            self.n_iter_ = 0
+
+        for start in range(0, data.shape[0], self.batch_size):
+            minibatch_update(
+                data[start : start + self.batch_size],
+                self.cluster_centers_,
+                self.counts_,
+                distance=self.distance,
+                aggregator=self.aggregator,
+            )
+        minibatch_update(
+            stereotypes,
+            self.cluster_centers_,
+            self.counts_,
+            aggregator=self.aggregator,
+            labels=self.n_clusters,
         )
+        self.n_iter_ += 1
+        self.labels_ = compute_labels(X, self.cluster_centers_, distance=self.distance)
+        return self
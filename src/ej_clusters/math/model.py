@@ -0,0 +1,170 @@
+from sidekick import import_later
+from sklearn import decomposition
+
+from .kmeans import DISTANCE_MAP, compute_labels, is_masked_distance, normalize_distance
+from .pipeline import float_dtype, identity_transformer
+
+np = import_later("numpy")
+sp = import_later("scipy.sparse")
+
+
+class ClusterModel:
+    """
+    A fitted clusterization model that can be stored as JSON.
+
+    It keeps the scaler statistics, the centroids and the order of comments
+    used by a clusterization pipeline, so users can be classified and
+    projected without re-fitting the pipeline or reading the votes of other
+    users.
+
+    Args:
+        comments:
+            Sequence of comment ids associated with each feature.
+        clusters:
+            Sequence of cluster ids associated with each centroid.
+        mean, scale:
+            Mean and scale of each feature in the fitted scaler.
+        centroids:
+            Array of (clusters, comments) with cluster centroids in the
+            scaled space.
+        components:
+            Optional (2, comments) array with the principal components of
+            the scaled data. It is used to project data in 2D.
+        distance:
+            Name of the distance used by the clusterization.
+    """
+
+    def __init__(
+        self, comments, clusters, mean, scale, centroids, components=None, distance=None
+    ):
+        self.comments = [int(comment) for comment in comments]
+        self.clusters = [int(cluster) for cluster in clusters]
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.centroids = np.asarray(centroids, dtype=float)
+        self.components = None if components is None else np.asarray(components)
+        self.distance = distance
+        self._index = {comment: i for i, comment in enumerate(self.comments)}
+
+    @classmethod
+    def from_pipeline(cls, pipeline, clusters, comments, data=None):
+        """
+        Create model from a fitted clusterization pipeline.
+
+        Return None if the pipeline does not have the default scale/clusterize
+        structure (e.g., when whitening is enabled).
+
+        Args:
+            pipeline:
+                Fitted pipeline created by clusterization_pipeline()
+            clusters:
+                Cluster ids associated with each label.
+            comments:
+                Comment ids associated with each column of the input data.
+            data:
+                Optional data used to fit the pipeline. If given, it is used to
+                compute the principal components of the scaled data.
+        """
+        steps = pipeline.named_steps
+        if steps.get("whiten") is not identity_transformer:
+            return None
+
+        scaler = steps["scale"]
+        clusterizer = steps["clusterize"]
+        components = None
+        if data is not None and min(data.shape) > 2:
+            # Scaled data is already centered, hence SVD is equivalent to PCA
+            # and works with sparse matrices.
+            scaled = scaler.transform(data)
+            components = decomposition.TruncatedSVD(2).fit(scaled).components_
+
+        distance = getattr(clusterizer, "distance", None)
+        return cls(
+            comments,
+            clusters,
+            scaler.mean_,
+            scaler.scale_,
+            clusterizer.cluster_centers_,
+            components=components,
+            distance=_distance_name(distance),
+        )
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        Create model from the result of :meth:`to_json`.
+        """
+        return cls(**data)
+
+    def to_json(self):
+        """
+        Return a JSON-compatible dictionary with model data.
+        """
+        components = self.components
+        return {
+            "comments": self.comments,
+            "clusters": self.clusters,
+            "mean": self.mean.tolist(),
+            "scale": self.scale.tolist(),
+            "centroids": self.centroids.tolist(),
+            "components": None if components is None else components.tolist(),
+            "distance": self.distance,
+        }
+
+    def transform(self, votes):
+        """
+        Scale a votes table with comment ids as columns and NaN as missing
+        values. Missing values and unknown comments are imputed with the mean
+        vote, which is zero after scaling.
+        """
+        votes = votes.reindex(columns=self.comments)
+        data = votes.to_numpy(dtype=float_dtype(votes.values), copy=True)
+        data -= self.mean
+        data /= self.scale
+        data[np.isnan(data)] = 0.0
+        return data
+
+    @property
+    def masked(self):
+        """
+        True if the model uses a masked distance, which ignores missing votes.
+        """
+        return is_masked_distance(normalize_distance(self.distance))
+
+    def transform_votes(self, votes):
+        """
+        Like :meth:`transform`, but receives a sequence of (comment, choice)
+        pairs for a single user and return a 1D array.
+
+        Missing votes are NaN if the model uses a masked distance, so
+        :meth:`predict` ignores them as the clusterization did.
+        """
+        data = np.full(len(self.comments), np.nan if self.masked else 0.0)
+        for comment, choice in votes:
+            i = self._index.get(comment)
+            if i is not None:
+                data[i] = (choice - self.mean[i]) / self.scale[i]
+        return data
+
+    def predict(self, data):
+        """
+        Return an array with the cluster id of each row of scaled data.
+        """
+        data = np.atleast_2d(data)
+        labels = compute_labels(data, self.centroids, normalize_distance(self.distance))
+        return np.asarray(self.clusters)[labels]
+
+    def project(self, data):
+        """
+        Project scaled data in 2D using the stored principal components.
+        """
+        if self.components is None:
+            raise ValueError("model does not have principal components")
+        return np.atleast_2d(data) @ self.components.T
+
+
+def _distance_name(func):
+    for name, value in DISTANCE_MAP.items():
+        if value is func:
+            return name
+    return None
@@ -1,36 +1,148 @@
 import sidekick as sk
+from sidekick import import_later
 from sklearn import pipeline as pipeline_, preprocessing, decomposition
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.utils.validation import check_is_fitted
 
-from .kmeans_sklearn import StereotypeKMeans
+from .kmeans_sklearn import MiniBatchStereotypeKMeans, StereotypeKMeans
+
+np = import_later("numpy")
+sp = import_later("scipy.sparse")
+votes_math = import_later("ej_conversations.math")
 
 
 #
 # Default pipeline
 #
-def clusterization_pipeline(whiten=False, distance=None, only_preprocess=False):
+def clusterization_pipeline(
+    whiten=False,
+    distance=None,
+    only_preprocess=False,
+    sparse=False,
+    aggregator=None,
+    masked=False,
+    batch_size=None,
+):
     """
     Define the main clusterization pipeline that starts with some vote_table().
     that should include some stereotype votes.
+
+    If sparse=True, the pipeline expects a sparse vote matrix (see
+    VoteQuerySet.votes_matrix()) with missing votes as non-stored entries and
+    imputes and standardizes it without densifying (see
+    :class:`MeanImputerScaler`).
+
+    If masked=True, the clusterizer uses the 'euclidean-finite' distance and
+    the 'mean-finite' aggregator, which ignore missing votes instead of
+    treating them as imputed means. It implies sparse=True.
+
+    If batch_size is given, clusters are found by
+    :class:`MiniBatchStereotypeKMeans` with batches of the given number of
+    rows. This is much faster in conversations with many participants.
     """
+    if masked:
+        sparse = True
+        distance = distance or "euclidean-finite"
+        aggregator = aggregator or "mean-finite"
 
     def make_pipeline(k):
-        scaler = preprocessing.StandardScaler()
+        if sparse:
+            scaler = MeanImputerScaler()
+        else:
+            scaler = preprocessing.StandardScaler()
         whitener = optional_whitener(whiten)
 
         # Select clusterizer
         if only_preprocess:
             clusterization_method = identity_transformer
+        elif batch_size is not None:
+            clusterization_method = MiniBatchStereotypeKMeans(
+                k, distance=distance, aggregator=aggregator, batch_size=batch_size
+            )
         else:
-            clusterization_method = StereotypeKMeans(k, distance=distance)
+            clusterization_method = StereotypeKMeans(
+                k, distance=distance, aggregator=aggregator
+            )
 
         return pipeline(scale=scaler, whiten=whitener, clusterize=clusterization_method)
 
     return make_pipeline
 
 
+def fit_predict_stages(pipeline, data, stats, **fit_params):
+    """
+    Like pipeline.fit_predict(), but record the time spent in each step of the
+    pipeline with the stage() context manager of the given
+    :class:`ej_clusters.utils.PipelineStats` object.
+    """
+    params = {name: {} for name, _ in pipeline.steps}
+    for key, value in fit_params.items():
+        name, _, param = key.partition("__")
+        params[name][param] = value
+
+    *transforms, (name, estimator) = pipeline.steps
+    for step_name, transform in transforms:
+        if transform is None or transform == "passthrough":
+            continue
+        with stats.stage(step_name):
+            data = transform.fit_transform(data, **params[step_name])
+    with stats.stage(name):
+        return estimator.fit_predict(data, **params[name])
+
+
+class MeanImputerScaler(TransformerMixin, BaseEstimator):
+    """
+    Fill missing values with the mean of each column and standardize data.
+
+    This is equivalent to a SimpleImputer followed by a StandardScaler, but it
+    also accepts sparse vote matrices, in which missing values are the
+    entries that are not stored. Imputed values are zero after centering,
+    hence sparse inputs are transformed into sparse outputs with the same
+    structure. Dense inputs use NaN to represent missing values.
+
+    Float inputs keep their precision and integer inputs (e.g., int8 vote
+    matrices) are transformed to float32.
+    """
+
+    def fit(self, X, y=None):  # noqa: N803
+        if not sp.issparse(X):
+            X = votes_math.sparse_from_dense(X)  # noqa: N806
+        mean, scale = votes_math.sparse_column_stats(X)
+        scale[scale == 0] = 1.0
+        self.mean_ = mean
+        self.scale_ = scale
+        return self
+
+    def transform(self, X):  # noqa: N803
+        check_is_fitted(self, "mean_")
+        if sp.issparse(X):
+            X = sp.csr_matrix(X, dtype=float_dtype(X), copy=True)  # noqa: N806
+            X.data -= self.mean_[X.indices]
+            X.data /= self.scale_[X.indices]
+            return X
+
+        X = np.asarray(X)  # noqa: N806
+        X = np.array(X, dtype=float_dtype(X))  # noqa: N806
+        X -= self.mean_
+        X /= self.scale_
+        X[np.isnan(X)] = 0.0
+        return X
+
+
 #
 # Utility methods
 #
+def float_dtype(data):
+    """
+    Return the dtype of data if it is a float type, or float32 otherwise.
+
+    Votes are small integers, hence float32 has enough precision to represent
+    them after scaling with half the memory of float64.
+    """
+    dtype = np.dtype(data.dtype)
+    return dtype if dtype.kind == "f" else np.dtype(np.float32)
+
+
 def pipeline(memory=None, **kwargs):
     """
     Helper function to declare pipelines that uses the fact that Python 3.6+
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("ej_clusters", "0003_barbara_remove_clusterization_counters")]
+
+    operations = [
+        migrations.AddField(
+            model_name="clusterization",
+            name="model_data",
+            field=models.JSONField(
+                blank=True,
+                editable=False,
+                help_text="Scaler statistics and centroids of the last clusterization.",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("ej_clusters", "0004_clusterization_model_data")]
+
+    operations = [
+        migrations.AddField(
+            model_name="clusterization",
+            name="model_watermark",
+            field=models.BigIntegerField(
+                default=0,
+                editable=False,
+                help_text="Id of the last vote considered in the last clusterization.",
+            ),
+        ),
+    ]
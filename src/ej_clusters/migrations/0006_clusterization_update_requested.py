@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("ej_clusters", "0005_clusterization_model_watermark")]
+
+    operations = [
+        migrations.AddField(
+            model_name="clusterization",
+            name="update_requested",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="Time of the oldest pending request for a new clusterization.",
+                null=True,
+            ),
+        ),
+    ]
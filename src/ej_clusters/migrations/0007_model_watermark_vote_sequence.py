@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+def convert_watermarks(apps, schema_editor):
+    """
+    Model watermarks used to store the id of the last processed vote. Convert
+    them to the number of processed votes, which can be compared to the vote
+    sequence of the conversation.
+    """
+    Clusterization = apps.get_model("ej_clusters", "Clusterization")
+    Vote = apps.get_model("ej_conversations", "Vote")
+    for clusterization in Clusterization.objects.filter(model_watermark__gt=0):
+        n_votes = Vote.objects.filter(
+            comment__conversation_id=clusterization.conversation_id,
+            id__lte=clusterization.model_watermark,
+        ).count()
+        Clusterization.objects.filter(id=clusterization.id).update(
+            model_watermark=n_votes
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ej_clusters", "0006_clusterization_update_requested"),
+        ("ej_conversations", "0034_conversation_vote_sequence"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="clusterization",
+            name="model_watermark",
+            field=models.BigIntegerField(
+                default=0,
+                editable=False,
+                help_text="Vote sequence of the conversation in the last clusterization.",
+            ),
+        ),
+        migrations.RunPython(convert_watermarks, migrations.RunPython.noop),
+    ]
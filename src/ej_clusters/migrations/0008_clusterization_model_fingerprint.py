@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("ej_clusters", "0007_model_watermark_vote_sequence")]
+
+    operations = [
+        migrations.AddField(
+            model_name="clusterization",
+            name="model_fingerprint",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="Hash of the input data of the last clusterization.",
+                max_length=40,
+            ),
+        ),
+    ]
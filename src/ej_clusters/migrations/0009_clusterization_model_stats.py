@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("ej_clusters", "0008_clusterization_model_fingerprint")]
+
+    operations = [
+        migrations.AddField(
+            model_name="clusterization",
+            name="model_stats",
+            field=models.JSONField(
+                blank=True,
+                editable=False,
+                help_text="Timings, peak memory and data shape of the last clusterization.",
+                null=True,
+            ),
+        ),
+    ]
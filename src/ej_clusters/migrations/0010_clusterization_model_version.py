@@ -0,0 +1,18 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("ej_clusters", "0009_clusterization_model_stats")]
+
+    operations = [
+        migrations.AddField(
+            model_name="clusterization",
+            name="model_version",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of times clusters were recomputed.",
+            ),
+        ),
+    ]
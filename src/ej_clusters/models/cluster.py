@@ -1,14 +1,11 @@
 from boogie import models
 from django.contrib.auth import get_user_model
-from django.db.models import Subquery
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from model_utils.models import TimeStampedModel
 from sidekick import delegate_to, lazy, import_later, placeholder as this
 
-from ej_conversations.models import Comment
 from .cluster_queryset import ClusterManager
-from .stereotype_vote import StereotypeVote
 
 pd = import_later("pandas")
 np = import_later("numpy")
@@ -68,15 +65,10 @@ class Cluster(TimeStampedModel):
         """
         Return the mean stereotype for cluster.
         """
-        stereotypes = self.stereotypes.all()
-        votes = StereotypeVote.objects.filter(
-            author__in=Subquery(stereotypes.values("id"))
-        ).values_list("comment", "choice")
-        df = pd.DataFrame(list(votes), columns=["comment", "choice"])
-        if len(df) == 0:
+        votes = Cluster.objects.filter(id=self.id).mean_stereotype_votes()
+        if self.id not in votes.index:
             return pd.DataFrame([], columns=["choice"])
-        else:
-            return df.pivot_table("choice", index="comment", aggfunc="mean")
+        return votes.loc[self.id].dropna().rename("choice").to_frame()
 
     def comments_statistics_summary_dataframe(self, normalization=1.0):
         """
@@ -92,50 +84,12 @@ class Cluster(TimeStampedModel):
         comments that cluster disagree.
 
         By default, only comments with participation statistic higher than 30% are returned.
-        """
-        tol = 1e-6
-        table = self.votes.votes_table()
-
-        n_agree = (table > 0).sum()
-        n_disagree = (table < 0).sum()
-        total = n_agree + n_disagree + (table == 0).sum() + tol
 
-        d_agree = dict(((n_agree[n_agree >= n_disagree] + tol) / total).dropna().items())
-        d_disagree = dict(
-            ((n_disagree[n_disagree > n_agree] + tol) / total).dropna().items()
-        )
-
-        agree = []
-        disagree = []
-
-        comments_df = self.comments_statistics_summary_dataframe()
-        relevant_comments = comments_df[
-            comments_df["participation"] >= participation_index
-        ]
-
-        for comment in Comment.objects.filter(id__in=d_agree):
-            # It would accept 0% agreement since we test sfor n_agree >= n_disagree
-            # We must prevent cases with 0 agrees (>= 0 disagrees) to enter in
-            # the calculation
-            n_agree = d_agree[comment.id]
-            comment_is_relevant = comment.id in relevant_comments.index
-            if n_agree and comment_is_relevant:
-                comment.agree = n_agree
-                comment.participation = relevant_comments.loc[comment.id]["participation"]
-                agree.append(comment)
-
-        for comment in Comment.objects.filter(id__in=d_disagree):
-            comment_is_relevant = comment.id in relevant_comments.index
-            if comment_is_relevant:
-                comment.disagree = d_disagree[comment.id]
-                comment.participation = relevant_comments.loc[comment.id]["participation"]
-                disagree.append(comment)
-
-        if sort:
-            agree.sort(key=lambda c: c.agree, reverse=True)
-            disagree.sort(key=lambda c: c.disagree, reverse=True)
-
-        return agree, disagree
+        Use :meth:`ClusterQuerySet.separate_comments` to compute it for
+        several clusters at once.
+        """
+        clusters = Cluster.objects.filter(id=self.id)
+        return clusters.separate_comments(sort, participation_index)[self.id]
 
     def concat_statistics_to_dataframe(self, df: pd.DataFrame = pd.DataFrame()):
         """
@@ -1,22 +1,35 @@
+import copy
+import hashlib
 from logging import getLogger
 
-from boogie.models import QuerySet, F, Manager, Value, IntegerField
+from boogie.models import QuerySet, F, Manager
+from django.db import transaction
+from django.db.models import Avg, Count, FloatField, Max, Sum
 from sidekick import import_later
 from django.contrib.auth import get_user_model
 
-from ej_conversations.math import imputation
-from ej_conversations.models import Conversation, Comment
+from ej_conversations.math import imputation, masked_column_means, sparse_from_dense
+from ej_conversations.models import Conversation, Comment, Vote
+from ej_conversations import snapshots
 from ..mixins import ClusterizationBaseMixin
+from ..utils import PipelineStats, record_cache_access
 
 pd = import_later("pandas")
 np = import_later("numpy")
-impute = import_later("sklearn.impute")
+sp = import_later("scipy.sparse")
 clusterization_pipeline = import_later(
     "..math:clusterization_pipeline", package=__package__
 )
+fit_predict_stages = import_later("..math:fit_predict_stages", package=__package__)
+ClusterModel = import_later("..math:ClusterModel", package=__package__)
+StereotypeKMeans = import_later(
+    "..math.kmeans_sklearn:StereotypeKMeans", package=__package__
+)
 models = import_later(".models", package=__package__)
 log = getLogger("ej")
 
+MEMBERSHIP_BATCH_SIZE = 5000
+
 
 class ClusterQuerySet(ClusterizationBaseMixin, QuerySet):
     """
@@ -161,7 +174,7 @@ class ClusterQuerySet(ClusterizationBaseMixin, QuerySet):
 
         if cluster_col is not None:
             if self.count():
-                clusters = self._get_cluster_to_user_column_table("stereotypes")
+                clusters = self.cluster_map("stereotypes")
                 if not kind_col and len(clusters.index) != 0:
                     clusters.index *= -1
             else:
@@ -178,39 +191,157 @@ class ClusterQuerySet(ClusterizationBaseMixin, QuerySet):
 
         if cluster_col is not None:
             if self.count():
-                clusters = self._get_cluster_to_user_column_table("users")
+                clusters = self.cluster_map("users")
             else:
                 clusters = float("nan")
             user_votes[cluster_col] = clusters
         return user_votes
 
-    def _get_cluster_to_user_column_table(self, user_field="users"):
-        int_field = IntegerField()
-
-        cluster, *rest = self
-        users = list(
-            getattr(cluster, user_field)
-            .annotate(cluster=Value(cluster.id, output_field=int_field))
-            .values_list("id", "cluster")
-        )
+    def cluster_map(self, field="users"):
+        """
+        Return a series mapping user ids to the id of their cluster.
 
-        for cl in rest:
-            users.extend(
-                getattr(cl, user_field)
-                .annotate(cluster=Value(cl.id, output_field=int_field))
-                .values_list("id", "cluster")
+        It reads the Cluster.users (or Cluster.stereotypes, if
+        field="stereotypes") m2m table in a single query, regardless of the
+        number of clusters. The index is named "author" and values are int64
+        cluster ids.
+        """
+        m2m_field = self.model._meta.get_field(field)
+        source = m2m_field.m2m_field_name()
+        target = m2m_field.m2m_reverse_field_name()
+        pairs = (
+            m2m_field.remote_field.through.objects.filter(
+                **{f"{source}__in": self.values("id")}
             )
+            .order_by(f"{source}_id", "id")
+            .values_list(f"{target}_id", f"{source}_id")
+        )
+        data = np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+        col = pd.Series(
+            data[:, 1], index=pd.Index(data[:, 0], name="author"), name="cluster"
+        )
 
         # Remove duplicates from cluster/user pairs
         # This should never happen, but sometimes it does and we don't want to
         # crash the application due to a minor bug.
-        data = list(dict(users).items())
-        col = pd.DataFrame(data, columns=["user", "cluster"])
-        col.index = col.pop("user")
-        col.index.name = "author"
-        return col.pop("cluster")
+        return col[~col.index.duplicated(keep="last")]
+
+    def separate_comments(self, sort=True, participation_index=0.30):
+        """
+        Compute :meth:`ej_clusters.models.Cluster.separate_comments` for all
+        clusters in the queryset.
+
+        Votes are counted by cluster, comment and choice in a single grouped
+        query and comments are fetched once for all clusters.
+
+        Returns:
+            A map from cluster ids to (agree, disagree) lists of comments.
+        """
+        tol = 1e-6
+        cluster_ids = list(self.values_list("id", flat=True))
+        result = {cluster_id: ([], []) for cluster_id in cluster_ids}
+
+        # Votes of users in each cluster, restricted to the cluster conversation
+        votes = Vote.objects.filter(
+            author__clusters__in=cluster_ids,
+            comment__conversation=F("author__clusters__clusterization__conversation"),
+        ).order_by()
+        counts = votes.values_list("author__clusters", "comment", "choice").annotate(
+            count=Count("id")
+        )
+        counts = pd.DataFrame(
+            list(counts), columns=["cluster", "comment", "choice", "count"]
+        )
+        if counts.empty:
+            return result
+
+        table = counts.pivot_table(
+            index=["cluster", "comment"],
+            columns="choice",
+            values="count",
+            aggfunc="sum",
+            fill_value=0,
+        )
+        table = table.reindex(columns=[1, -1, 0], fill_value=0)
+        n_agree, n_disagree, n_skip = (table[c].values for c in (1, -1, 0))
+        n_votes = n_agree + n_disagree + n_skip
+
+        # Participation is relative to the number of voters in each cluster
+        voters = dict(
+            votes.values_list("author__clusters").annotate(
+                count=Count("author", distinct=True)
+            )
+        )
+        clusters = table.index.get_level_values("cluster")
+        participation = n_votes / (clusters.map(voters).values + 1e-50)
+
+        table = pd.DataFrame(
+            {
+                "agree": (n_agree + tol) / (n_votes + tol),
+                "disagree": (n_disagree + tol) / (n_votes + tol),
+                "is_agree": n_agree >= n_disagree,
+                "participation": participation,
+            },
+            index=table.index,
+        )
+        table = table[table["participation"] >= participation_index]
+
+        comment_ids = table.index.get_level_values("comment").unique()
+        comments = Comment.objects.filter(id__in=list(comment_ids)).order_by("id")
+        comments = {comment.id: comment for comment in comments}
+        for (cluster_id, comment_id), row in table.iterrows():
+            comment = copy.copy(comments[comment_id])
+            comment.participation = row["participation"]
+            agree, disagree = result[cluster_id]
+            if row["is_agree"]:
+                comment.agree = row["agree"]
+                agree.append(comment)
+            else:
+                comment.disagree = row["disagree"]
+                disagree.append(comment)
+
+        if sort:
+            for agree, disagree in result.values():
+                agree.sort(key=lambda c: c.agree, reverse=True)
+                disagree.sort(key=lambda c: c.disagree, reverse=True)
+        return result
 
-    def find_clusters(self, pipeline_factory=None, commit=True):
+    def input_fingerprint(self):
+        """
+        Return a hash of the data used by :meth:`find_clusters`.
+
+        It summarizes the approved user votes by their count, maximum id, sum
+        and last modification time, and lists the approved comments, the
+        stereotype votes and the stereotypes of each cluster. Those queries
+        are much cheaper than fetching and clusterizing all votes.
+        """
+        votes = self.votes().filter(comment__status=Comment.STATUS.approved)
+        votes_summary = votes.aggregate(
+            count=Count("id"), max_id=Max("id"), sum=Sum("choice"), last=Max("created")
+        )
+        comments = self.comments().filter(status=Comment.STATUS.approved)
+        data = [
+            sorted(votes_summary.items()),
+            list(comments.order_by("id").values_list("id", flat=True)),
+            list(
+                self.stereotype_votes(comments)
+                .order_by("id")
+                .values_list("author_id", "comment_id", "choice")
+            ),
+            list(self.order_by("id", "stereotypes").values_list("id", "stereotypes")),
+        ]
+        return hashlib.sha1(repr(data).encode()).hexdigest()
+
+    def find_clusters(
+        self,
+        pipeline_factory=None,
+        commit=True,
+        sparse=False,
+        init_model=None,
+        fingerprint=None,
+        masked=False,
+        batch_size=None,
+    ):
         """
         Find clusters using the given clusterization pipeline and write results
         on the database.
@@ -225,87 +356,227 @@ class ClusterQuerySet(ClusterizationBaseMixin, QuerySet):
                 :func:`ej_clusters.math.clusterization_pipeline`.
             commit (bool):
                 If False, prevents it from updating the database.
+            sparse (bool):
+                If True, read votes with VoteQuerySet.votes_matrix() and feed
+                a sparse matrix to the pipeline instead of an imputed dense
+                table. The default pipeline is created with sparse=True.
+            init_model (ClusterModel):
+                Model of a previous clusterization. If given, warm-start the
+                clusterization from its centroids and from the current cluster
+                of each user.
+            fingerprint (str):
+                Result of :meth:`input_fingerprint` in the last clusterization.
+                If it did not change, the pipeline is not fitted and the
+                current clusters are returned with the .cached attribute set
+                to True. Ignored if a pipeline_factory is given.
+            masked (bool):
+                If True, read votes as a sparse matrix and ignore missing votes
+                when computing distances and centroids instead of imputing
+                them. Implies sparse=True.
+            batch_size (int):
+                If given, use mini-batch k-means with batches of the given
+                number of users (see :func:`clusterization_pipeline`).
 
         Returns:
             A pair with a mapping from clusters ids to the corresponding sequence
             of user ids. The mapping has a .pipeline attribute that holds the
-            resulting clusterization pipeline.
+            resulting clusterization pipeline, a .model attribute with the
+            corresponding :class:`ej_clusters.math.ClusterModel`, a .n_iter
+            attribute with the number of k-means iterations and a .fingerprint
+            attribute with the fingerprint of the input data. The .n_inserted
+            and .n_deleted attributes count the cluster membership rows
+            changed in the database and .stats is a :class:`PipelineStats`
+            with the timings of each stage.
         """
 
+        stats = PipelineStats()
         cluster_ids = list(self.values_list("id", flat=True))
         n_clusters = len(cluster_ids)
 
         # Check the number of clusters to initialize the pipeline
-        pipeline_factory = pipeline_factory or clusterization_pipeline()
+        custom_pipeline = pipeline_factory is not None
+        sparse = sparse or masked
+        pipeline_factory = pipeline_factory or clusterization_pipeline(
+            sparse=sparse, masked=masked, batch_size=batch_size
+        )
         pipeline = pipeline_factory(n_clusters)
         if n_clusters == 0:
             log.error("Trying to clusterize empty cluster set.")
-            return ClusterDict(pipeline=pipeline)
+            return ClusterDict(pipeline=pipeline, stats=stats)
         elif n_clusters == 1:
             log.warning("Creating clusters for cluster set with a single element.")
+        stats["n_clusters"] = n_clusters
+
+        # Reuse the current clusters if the input data did not change
+        with stats.stage("fingerprint"):
+            current_fingerprint = self.input_fingerprint()
+        if fingerprint is not None and not custom_pipeline:
+            hit = fingerprint == current_fingerprint
+            record_cache_access("find_clusters", hit)
+            stats["cached"] = hit
+            if hit:
+                log.info("[clusters] votes did not change, reusing clusters.")
+                users = self.cluster_map("users")
+                return ClusterDict(
+                    {id: users[users == id].index.values for id in cluster_ids},
+                    pipeline=pipeline,
+                    model=init_model,
+                    fingerprint=current_fingerprint,
+                    cached=True,
+                    stats=stats,
+                )
 
         # Collect votes
-        imputer = impute.SimpleImputer()
         votes_qs = self.votes().filter(comment__status=Comment.STATUS.approved)
-        user_votes = votes_qs.votes_table()
-        if not user_votes.empty:
-            user_votes.values[:] = imputer.fit_transform(user_votes)
-            cluster_votes = self._cluster_votes(cluster_ids, votes_qs)
+        if sparse:
+            votes_data, user_ids, comment_ids = self._sparse_votes_data(
+                cluster_ids, votes_qs, stats
+            )
+        else:
+            votes_data, user_ids, comment_ids = self._dense_votes_data(
+                cluster_ids, votes_qs, stats
+            )
+
+        if votes_data is not None:
+            n_rows, n_cols = votes_data.shape
+            n_stored = votes_data.nnz if sp.issparse(votes_data) else n_rows * n_cols
+            stats["shape"] = [n_rows, n_cols]
+            stats["density"] = n_stored / max(n_rows * n_cols, 1)
 
-            # Aggregate user and cluster votes
-            cluster_votes = pd.DataFrame(cluster_votes)
-            cluster_votes.index *= -1
-            votes = user_votes.append(cluster_votes)
-            votes_data = imputer.transform(votes.values)
+            fit_params = {}
+            if init_model is not None:
+                fit_params = self._warm_start_params(
+                    pipeline, init_model, cluster_ids, user_ids, comment_ids
+                )
 
             # Find labels and associate them with cluster labels
-            labels = [cluster_ids[i] for i in pipeline.fit_predict(votes_data)]
+            labels = fit_predict_stages(pipeline, votes_data, stats, **fit_params)
+            labels = [cluster_ids[i] for i in labels]
             user_labels = labels[:-n_clusters]
             user_labels = pd.DataFrame(
-                [list(user_votes.index), user_labels], index=["user", "label"]
+                [list(user_ids), user_labels], index=["user", "label"]
             ).T
             stereotype_labels = labels[len(user_labels) :]
 
-            return self._save_clusterization(
-                pipeline, cluster_ids, stereotype_labels, user_labels, commit
-            )
+            with stats.stage("save"):
+                result = self._save_clusterization(
+                    pipeline, cluster_ids, stereotype_labels, user_labels, commit
+                )
+            with stats.stage("model"):
+                result.model = ClusterModel.from_pipeline(
+                    pipeline, cluster_ids, comment_ids, votes_data
+                )
+            result.n_iter = getattr(pipeline.steps[-1][1], "n_iter_", None)
+            result.fingerprint = current_fingerprint
+            result.stats = stats
+            stats["n_iter"] = None if result.n_iter is None else int(result.n_iter)
+            stats["n_inserted"] = result.n_inserted
+            stats["n_deleted"] = result.n_deleted
+            log.info(f"[clusters] k-means finished after {result.n_iter} iterations")
+            return result
+
+    def _warm_start_params(self, pipeline, model, cluster_ids, user_ids, comment_ids):
+        # Fit parameters that initialize StereotypeKMeans with the centroids of
+        # the given model and the current cluster of each user.
+        if not isinstance(pipeline.steps[-1][1], StereotypeKMeans):
+            return {}
+        if set(model.clusters) != set(cluster_ids):
+            log.info("[clusters] clusters have changed, skipping warm start.")
+            return {}
+
+        centroids = pd.DataFrame(
+            model.centroids, index=model.clusters, columns=model.comments
+        )
+        centroids = centroids.reindex(
+            index=cluster_ids, columns=list(comment_ids), fill_value=0.0
+        )
+        label_map = {cluster_id: i for i, cluster_id in enumerate(cluster_ids)}
+        labels = self.cluster_map("users")
+        labels = labels.reindex(list(user_ids)).map(label_map).fillna(-1)
+
+        name = pipeline.steps[-1][0]
+        return {
+            f"{name}__init_centroids": centroids.values,
+            f"{name}__init_labels": labels.values.astype(int),
+        }
+
+    def _dense_votes_data(self, cluster_ids, votes_qs, stats):
+        # Return the imputed (users + clusters, comments) float32 array of votes
+        # and the user and comment ids associated with its rows and columns.
+        # User votes are read as an int8 matrix with a mask of missing votes,
+        # and missing values are filled with the mean vote of users in each
+        # comment.
+        with stats.stage("votes"):
+            conversation = self._snapshot_conversation()
+            if conversation is not None:
+                user_votes, missing, user_ids, comment_ids = snapshots.votes_array(
+                    conversation
+                )
+            else:
+                user_votes, missing, user_ids, comment_ids = votes_qs.votes_array()
+        if user_votes.size == 0:
+            return None, (), ()
+
+        with stats.stage("stereotype_votes"):
+            cluster_votes = self._cluster_votes(cluster_ids, votes_qs)
+            cluster_votes = cluster_votes.reindex(columns=comment_ids)
+
+        # Aggregate user and cluster votes
+        with stats.stage("impute"):
+            n_users = len(user_ids)
+            mean = masked_column_means(user_votes, missing).astype(np.float32)
+            votes = np.empty((n_users + len(cluster_ids), len(comment_ids)), np.float32)
+            votes[:n_users] = user_votes
+            np.copyto(votes[:n_users], mean, where=missing)
+            votes[n_users:] = cluster_votes.values
+            np.copyto(votes[n_users:], mean, where=np.isnan(votes[n_users:]))
+        return votes, user_ids, comment_ids
+
+    def _snapshot_conversation(self):
+        # Return the conversation of the cluster set if votes can be read from
+        # a vote snapshot, and None otherwise.
+        if snapshots.snapshots_dir() is None:
+            return None
+        conversations = list(self.conversations().distinct()[:2])
+        return conversations[0] if len(conversations) == 1 else None
+
+    def _sparse_votes_data(self, cluster_ids, votes_qs, stats):
+        # Like _dense_votes_data(), but return a sparse matrix without imputing
+        # missing votes. Comments without user votes are ignored.
+        with stats.stage("votes"):
+            user_votes, user_ids, comment_ids = votes_qs.votes_matrix(np.int8)
+        if user_votes.nnz == 0:
+            return None, (), ()
+
+        with stats.stage("stereotype_votes"):
+            cluster_votes = self._cluster_votes(cluster_ids, votes_qs)
+            cluster_votes = cluster_votes.reindex(columns=comment_ids)
+            cluster_votes = sparse_from_dense(cluster_votes.values, np.float32)
+            votes = sp.vstack([user_votes, cluster_votes], format="csr")
+        return votes, user_ids, comment_ids
 
     def _cluster_votes(self, cluster_ids, votes):
+        # Return a (clusters, comments) dataframe with the mean stereotype
+        # votes of each cluster, considering missing votes as zeros.
         comments = Comment.objects.filter(
             id__in=votes.values_list("comment_id", flat=True)
         )
-        stereotype_votes = self.stereotype_votes(comments).votes_table("zero")
-        stereotype_ids = self.dataframe("id", "stereotypes__id", index=None)
-
-        stereotype_with_votes = list(
-            set(self.stereotype_votes(comments).values_list("author__id", flat=True))
-        )
-        stereotype_ids = stereotype_ids[
-            stereotype_ids["stereotypes__id"].isin(stereotype_with_votes)
-        ]
-
-        cluster_votes = []
-        for cluster_id in cluster_ids:
-            ids = stereotype_ids[stereotype_ids.id == cluster_id]["stereotypes__id"]
-            mean_votes = stereotype_votes.loc[ids].mean(0)
-
-            # We fill empty clusters with random values to avoid superposition of
-            # clusters
-            if (mean_votes == 0).all():
-                clusterization = self.get(id=cluster_id).clusterization
-                log.warning(
-                    f"[clusters] cluster {cluster_id} of {clusterization} is empty!"
-                )
-                mean_votes.values[:] = np.random.uniform(-1, 1, size=len(mean_votes))
-
-            mean_votes.name = cluster_id
-            cluster_votes.append(mean_votes)
+        cluster_votes = self.mean_stereotype_votes(comments, fill_zero=True)
+        cluster_votes = cluster_votes.reindex(index=cluster_ids)
+
+        # We fill empty clusters with random values to avoid superposition of
+        # clusters
+        empty = (cluster_votes == 0).all(axis=1).values
+        for cluster_id in cluster_votes.index[empty]:
+            log.warning(f"[clusters] cluster {cluster_id} is empty!")
+        if empty.any():
+            shape = (empty.sum(), cluster_votes.shape[1])
+            cluster_votes.loc[empty] = np.random.uniform(-1, 1, size=shape)
         return cluster_votes
 
     def _save_clusterization(self, pipeline, cluster_ids, stereotype, user, commit=True):
         result = ClusterDict(pipeline=pipeline)
-        m2m_objects = []
-        m2m = self.model.users.through
+        memberships = set()
         for expected_id, got_id in zip(cluster_ids, stereotype):
             if expected_id != got_id:
                 expected = self.get(id=expected_id)
@@ -317,37 +588,88 @@ class ClusterQuerySet(ClusterizationBaseMixin, QuerySet):
 
             user_ids = user[user.label == expected_id].user.values
             result[expected_id] = user_ids
-            if commit:
-                m2m_objects.extend(
-                    m2m(cluster_id=expected_id, user_id=uid) for uid in user_ids
-                )
+            memberships.update((expected_id, int(uid)) for uid in user_ids)
 
         if commit:
-            m2m.objects.filter(cluster__in=cluster_ids).delete()
-            m2m.objects.bulk_create(m2m_objects)
+            result.n_inserted, result.n_deleted = self._update_memberships(
+                cluster_ids, memberships
+            )
+            log.info(
+                f"[clusters] cluster memberships updated: {result.n_inserted} "
+                f"inserted, {result.n_deleted} deleted"
+            )
         return result
 
+    def _update_memberships(self, cluster_ids, memberships):
+        # Apply the difference between the current cluster/user rows and the
+        # given set of (cluster id, user id) pairs. Return the number of
+        # inserted and deleted rows.
+        m2m = self.model.users.through
+        current = m2m.objects.filter(cluster__in=cluster_ids).values_list(
+            "id", "cluster_id", "user_id"
+        )
+
+        delete_ids = []
+        kept = set()
+        for row_id, cluster_id, user_id in current.iterator():
+            pair = (cluster_id, user_id)
+            if pair in memberships and pair not in kept:
+                kept.add(pair)
+            else:
+                delete_ids.append(row_id)
+        new_rows = [
+            m2m(cluster_id=cluster_id, user_id=user_id)
+            for cluster_id, user_id in memberships - kept
+        ]
+
+        with transaction.atomic():
+            for i in range(0, len(delete_ids), MEMBERSHIP_BATCH_SIZE):
+                batch = delete_ids[i : i + MEMBERSHIP_BATCH_SIZE]
+                m2m.objects.filter(id__in=batch).delete()
+            m2m.objects.bulk_create(new_rows, batch_size=MEMBERSHIP_BATCH_SIZE)
+        return len(new_rows), len(delete_ids)
+
+    def mean_stereotype_votes(self, comments=None, fill_zero=False):
+        """
+        Return a (clusters, comments) dataframe with the average vote of the
+        stereotypes of each cluster.
+
+        Votes are aggregated by cluster and comment in a single grouped query.
+        Clusters without stereotype votes are not included.
+
+        Args:
+            comments:
+                Queryset of comments considered in the table. By default, use
+                all comments from the conversations of the cluster set.
+            fill_zero (bool):
+                If True, a missing vote counts as a zero vote from each
+                stereotype that voted in any of the given comments. Otherwise,
+                average only the cast votes.
+        """
+        votes = self.stereotype_votes(comments).filter(author__clusters__in=self)
+        votes = votes.order_by()
+        value = Sum("choice") if fill_zero else Avg("choice", output_field=FloatField())
+        data = votes.values_list("author__clusters", "comment").annotate(value=value)
+        data = pd.DataFrame(list(data), columns=["cluster", "comment", "value"])
+        table = data.pivot(index="cluster", columns="comment", values="value")
+        table = table.astype(float)
+
+        if fill_zero:
+            n_stereotypes = votes.values_list("author__clusters").annotate(
+                count=Count("author", distinct=True)
+            )
+            n_stereotypes = pd.Series(dict(n_stereotypes), dtype=float)
+            table = table.fillna(0).div(n_stereotypes.reindex(table.index), axis=0)
+        return table
+
     def mean_stereotypes_votes_table(self, data_imputation=None):
         """
         Return a dataframe with the average vote per cluster considering all
         stereotypes in the cluster.
         """
-        votes = (
-            self.stereotype_votes()
-            .annotate(cluster=F.author.clusters)
-            .dataframe("author", "comment", "choice", "cluster")
-        )
-
-        if votes.shape[0]:
-            votes = votes.pivot_table(
-                values="choice", index=["author", "cluster"], columns="comment"
-            )
-        else:
+        votes = self.mean_stereotype_votes()
+        if not votes.shape[0]:
             raise ValueError("no votes found")
-
-        votes["cluster"] = votes.index.get_level_values("cluster")
-        votes.index = np.arange(votes.shape[0])
-        votes = votes.groupby("cluster").mean()
         return imputation(votes, data_imputation)
 
 
@@ -371,6 +693,21 @@ class ClusterDict(dict):
     Custom dict class that stores extra attributes.
     """
 
-    def __init__(self, d=(), pipeline=None):
+    def __init__(
+        self,
+        d=(),
+        pipeline=None,
+        model=None,
+        n_iter=None,
+        fingerprint=None,
+        cached=False,
+        stats=None,
+    ):
         super().__init__(d)
         self.pipeline = pipeline
+        self.model = model
+        self.n_iter = n_iter
+        self.fingerprint = fingerprint
+        self.cached = cached
+        self.stats = stats
+        self.n_inserted = self.n_deleted = 0
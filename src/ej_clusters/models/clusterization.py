@@ -3,20 +3,23 @@ from logging import getLogger
 
 from boogie import models, rules
 from boogie.fields import EnumField
+from django.db import transaction
 from django.db.models import Count, F
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from model_utils.models import TimeStampedModel
-from sidekick import delegate_to, lazy, placeholder as this
+from sidekick import delegate_to, import_later, lazy, placeholder as this
 
 from ..enums import ClusterStatus
-from ..utils import cluster_shapes, use_transaction
+from ..math import compute_cluster_affinities
+from ..utils import cluster_shapes, get_or_set, single_flight, use_transaction
 from .querysets import ClusterizationManager
 from .stereotype import Stereotype
 from .stereotype_vote import StereotypeVote
 
 NOT_GIVEN = object()
 log = getLogger("ej")
+ClusterModel = import_later("..math:ClusterModel", package=__package__)
 
 
 class Clusterization(TimeStampedModel):
@@ -30,6 +33,40 @@ class Clusterization(TimeStampedModel):
         related_name="clusterization",
     )
     cluster_status = EnumField(ClusterStatus, default=ClusterStatus.PENDING_DATA)
+    model_data = models.JSONField(
+        blank=True,
+        null=True,
+        editable=False,
+        help_text=_("Scaler statistics and centroids of the last clusterization."),
+    )
+    model_watermark = models.BigIntegerField(
+        default=0,
+        editable=False,
+        help_text=_("Vote sequence of the conversation in the last clusterization."),
+    )
+    model_fingerprint = models.CharField(
+        max_length=40,
+        blank=True,
+        editable=False,
+        help_text=_("Hash of the input data of the last clusterization."),
+    )
+    model_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text=_("Number of times clusters were recomputed."),
+    )
+    model_stats = models.JSONField(
+        blank=True,
+        null=True,
+        editable=False,
+        help_text=_("Timings, peak memory and data shape of the last clusterization."),
+    )
+    update_requested = models.DateTimeField(
+        blank=True,
+        null=True,
+        editable=False,
+        help_text=_("Time of the oldest pending request for a new clusterization."),
+    )
     comments = delegate_to("conversation")
     users = delegate_to("conversation")
     votes = delegate_to("conversation")
@@ -45,7 +82,46 @@ class Clusterization(TimeStampedModel):
 
     @property
     def n_unprocessed_votes(self):
-        return self.conversation.votes.filter(created__gte=self.modified).count()
+        """
+        Number of votes cast since the last clusterization.
+        """
+        return self.vote_watermark - self.model_watermark
+
+    @property
+    def model(self):
+        """
+        The :class:`ej_clusters.math.ClusterModel` fitted in the last
+        clusterization, or None.
+        """
+        data = self.model_data
+        if not data:
+            return None
+        if getattr(self, "_model_cache", (None, None))[0] is not data:
+            self._model_cache = (data, ClusterModel.from_json(data))
+        return self._model_cache[1]
+
+    @property
+    def vote_watermark(self):
+        """
+        Current vote sequence of the conversation, read from the database.
+        """
+        conversation_model = self._meta.get_field("conversation").related_model
+        conversations = conversation_model.objects.filter(id=self.conversation_id)
+        return conversations.values_list("vote_sequence", flat=True).first() or 0
+
+    @property
+    def update_time(self):
+        """
+        Total time in seconds spent by the last clusterization, or None.
+        """
+        return (self.model_stats or {}).get("time")
+
+    @property
+    def is_model_current(self):
+        """
+        True if no vote was cast since the stored model was fitted.
+        """
+        return self.model is not None and self.model_watermark >= self.vote_watermark
 
     #
     # Statistics and annotated values
@@ -69,29 +145,178 @@ class Clusterization(TimeStampedModel):
             kwargs=self.conversation.get_url_kwargs(),
         )
 
-    def update_clusterization(self, force=False, atomic=False):
+    def update_clusterization(self, force=False, atomic=False, warm_start=True):
         """
         Update clusters if necessary, unless force=True, in which it
         unconditionally updates the clusterization.
+
+        If warm_start=True (default), the k-means step starts from the model
+        stored in the last clusterization, which usually converges in one or
+        two iterations.
+
+        The pipeline is not fitted again if the votes and stereotypes did not
+        change since the last clusterization.
+
+        Only one process updates a given clusterization at a time. If another
+        process is already updating it, return immediately and keep the last
+        committed clusters.
+
+        Returns:
+            True if clusters were recomputed and False otherwise. Updates that
+            reuse the last clusters because the input did not change return
+            False.
         """
-        if force or rules.test_rule("ej.must_update_clusterization", self):
-            log.info(f"[clusters] updating cluster: {self.conversation}")
-
-            if self.clusters.count() == 0:
-                if self.cluster_status == ClusterStatus.ACTIVE:
-                    self.cluster_status = ClusterStatus.PENDING_DATA
-                self.save()
-                return
-
-            with use_transaction(atomic=atomic):
-                try:
-                    self.clusters.find_clusters()
-                except ValueError as exc:
-                    log.error(f"[clusters] Error during clusterization: [{exc}]")
-                    raise
-                if self.cluster_status == ClusterStatus.PENDING_DATA:
-                    self.cluster_status = ClusterStatus.ACTIVE
-                self.save()
+        rule = "ej.must_update_clusterization"
+        if not (force or rules.test_rule(rule, self)):
+            return False
+
+        with single_flight(self.update_lock_key) as acquired:
+            if not acquired:
+                log.info(f"[clusters] {self.conversation}: update already in progress")
+                return False
+
+            # Another process may have finished the update while we were
+            # testing the rule. Updates that reuse the last clusters only
+            # change the watermark
+            if not force:
+                self.refresh_from_db(
+                    fields=[
+                        "modified",
+                        "cluster_status",
+                        "model_watermark",
+                        "model_fingerprint",
+                        "model_data",
+                    ]
+                )
+                if not rules.test_rule(rule, self):
+                    return False
+            return self._update_clusterization(atomic, warm_start)
+
+    @property
+    def update_lock_key(self):
+        return f"ej_clusters.update_clusterization:{self.id}"
+
+    @property
+    def cache_version(self):
+        """
+        Version of cached data derived from the clusterization.
+
+        It changes only when update_clusterization() commits new clusters, so
+        stale entries are never read even if each process has its own cache.
+        Updates that reuse the current clusters keep the same version. Entries
+        expire after :data:`ej_clusters.utils.CACHE_TIMEOUT`.
+        """
+        return self.model_version
+
+    def cache_key(self, name):
+        """
+        Return the cache key for data with the given name, scoped to the
+        current version of the clusterization.
+        """
+        return f"ej_clusters.{name}:{self.id}:{self.cache_version}"
+
+    def cluster_affinities(self):
+        """
+        Return the result of :func:`ej_clusters.math.compute_cluster_affinities`
+        for all clusters. The result is cached until the next clusterization.
+        """
+        return self._cached(
+            "affinities",
+            lambda: compute_cluster_affinities(self.clusters.votes_table("mean")),
+        )
+
+    def separated_comments(self):
+        """
+        Return a map from cluster ids to the (agree, disagree) pair returned by
+        :meth:`Cluster.separate_comments`. The result is cached until the next
+        clusterization.
+        """
+        return self._cached("separated_comments", self.clusters.separate_comments)
+
+    def _cached(self, name, func):
+        return get_or_set(self.cache_key(name), func, stats=name)
+
+    def _update_clusterization(self, atomic, warm_start):
+        log.info(f"[clusters] updating cluster: {self.conversation}")
+
+        if self.clusters.count() == 0:
+            if self.cluster_status == ClusterStatus.ACTIVE:
+                self.cluster_status = ClusterStatus.PENDING_DATA
+            self.save()
+            return False
+
+        with use_transaction(atomic=atomic):
+            watermark = self.vote_watermark
+            try:
+                init_model = self.model if warm_start else None
+                result = self.clusters.find_clusters(
+                    init_model=init_model,
+                    fingerprint=self.model_fingerprint if self.model_data else None,
+                )
+            except ValueError as exc:
+                log.error(f"[clusters] Error during clusterization: [{exc}]")
+                raise
+            self.model_watermark = watermark
+            stats = getattr(result, "stats", None)
+            self.model_stats = None if stats is None else stats.to_json()
+
+            # Clusters did not change: only record the consumed votes, without
+            # touching the modified time or the cache version
+            if getattr(result, "cached", False):
+                Clusterization.objects.filter(id=self.id).update(
+                    model_watermark=self.model_watermark, model_stats=self.model_stats
+                )
+                return False
+
+            model = getattr(result, "model", None)
+            self.model_data = None if model is None else model.to_json()
+            self.model_fingerprint = getattr(result, "fingerprint", None) or ""
+            self.model_version = F("model_version") + 1
+            if self.cluster_status == ClusterStatus.PENDING_DATA:
+                self.cluster_status = ClusterStatus.ACTIVE
+            self.save()
+            self.refresh_from_db(fields=["model_version"])
+        return True
+
+    def predict_user(self, user):
+        """
+        Return the id of the cluster with the closest centroid to the given
+        user in the last clusterization, without re-fitting the clusterization
+        pipeline.
+
+        Only the votes of the given user are read from the database. Return
+        None if there is no stored model or the user did not vote in any
+        comment considered by it.
+        """
+        model = self.model
+        if model is None:
+            return None
+
+        votes = list(
+            self.conversation.votes.filter(
+                author=user, comment_id__in=model.comments
+            ).values_list("comment_id", "choice")
+        )
+        if not votes:
+            return None
+        return int(model.predict(model.transform_votes(votes))[0])
+
+    def assign_user(self, user):
+        """
+        Like :meth:`predict_user`, but also moves the user to the selected
+        cluster, updating only its own cluster membership rows.
+        """
+        cluster_id = self.predict_user(user)
+        if cluster_id is None:
+            return None
+
+        through = self.clusters.model.users.through
+        with transaction.atomic():
+            through.objects.filter(cluster__clusterization=self, user=user).exclude(
+                cluster_id=cluster_id
+            ).delete()
+            through.objects.get_or_create(cluster_id=cluster_id, user=user)
+        return cluster_id
 
     def get_stereotypes(self):
         return {
@@ -110,12 +335,15 @@ class Clusterization(TimeStampedModel):
         user_group = None
 
         try:
+            separated_comments = self.separated_comments()
             clusters = (
                 self.clusters.annotate(size=Count(F("users")))
-                .annotate_attr(separated_comments=lambda c: c.separate_comments())
+                .annotate_attr(
+                    separated_comments=lambda c: separated_comments.get(c.id, ([], []))
+                )
                 .prefetch_related("stereotypes")
             )
-            shapes = cluster_shapes(self, clusters, user)
+            shapes = cluster_shapes(self, user=user)
             shapes_json = json.dumps({"shapes": list(shapes.values())})
         except Exception as exc:
             exc_name = exc.__class__.__name__
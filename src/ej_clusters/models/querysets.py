@@ -33,6 +33,9 @@ class StereotypeVoteQuerySet(QuerySet):
 
     votes = lambda self: self
     votes_table = VoteQuerySet.votes_table
+    votes_matrix = VoteQuerySet.votes_matrix
+    votes_array = VoteQuerySet.votes_array
+    _votes_array = VoteQuerySet._votes_array
 
 
 class StereotypeQuerySet(UserMixin, QuerySet):
@@ -13,6 +13,7 @@ log = logging.getLogger("ej")
 VOTES_FOR_USER_TO_PARTICIPATE_IN_CLUSTERIZATION = 5
 VOTES_FOR_COMMENT_TO_PARTICIPATE_IN_CLUSTERIZATION = 5
 MINIMUM_NUMBER_OF_CLUSTERS = 2
+UNPROCESSED_VOTES_FOR_UPDATE = 5
 COOLDOWN_TIME = timedelta(minutes=5)
 
 
@@ -40,7 +41,7 @@ def must_update_clusterization(obj):
             and not rules.test_rule("ej.can_activate_clusterization", clusterization)
         )
         or clusterization.n_clusters >= 2
-        or clusterization.n_unprocessed_votes < 5
+        or clusterization.n_unprocessed_votes < UNPROCESSED_VOTES_FOR_UPDATE
     ):
         return False
 
@@ -0,0 +1,247 @@
+"""
+Schedule clusterization updates in background.
+
+Views do not recompute clusters. They call :func:`request_update`, which marks
+the clusterization as pending, and the ``scheduleclusterizations`` management
+command periodically sends the due clusterizations to the
+``update_clusterization`` dramatiq actor. Repeated requests for the same
+clusterization are coalesced into a single update.
+
+:func:`update_many` runs several updates at once in a pool of processes. It
+is used by the ``updateclusterizations`` management command to recluster
+conversations after deploys or data fixes.
+"""
+import os
+import signal
+from concurrent import futures
+from logging import getLogger
+from time import perf_counter
+
+from boogie import rules
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.db.models import F
+from django.utils.timezone import now
+from sidekick import import_later
+
+from .enums import ClusterStatus
+from .models import Clusterization
+from .rules import COOLDOWN_TIME, UNPROCESSED_VOTES_FOR_UPDATE
+
+log = getLogger("ej")
+tasks = import_later(".tasks", package=__package__)
+
+
+def request_update(clusterization):
+    """
+    Ask the scheduler to update the given clusterization.
+
+    Only the first request is recorded until the scheduler dispatches the
+    update, hence calling this function several times is cheap.
+
+    Returns:
+        True if a new request was recorded and False if the clusterization
+        was already pending.
+    """
+    pending = Clusterization.objects.filter(
+        id=clusterization.id, update_requested__isnull=True
+    )
+    return bool(pending.update(update_requested=now()))
+
+
+def due_clusterizations(time=None):
+    """
+    Return a queryset with the pending clusterizations that can be updated
+    at the given time, sorted by priority.
+
+    Clusterizations updated less than COOLDOWN_TIME ago or with too few votes
+    since the last update remain pending. The remaining ones are sorted by the
+    number of unprocessed votes (annotated as ``n_pending_votes``) and then by
+    the age of the request.
+    """
+    time = now() if time is None else time
+    return (
+        Clusterization.objects.filter(
+            update_requested__isnull=False,
+            modified__lt=time - COOLDOWN_TIME,
+        )
+        .exclude(cluster_status=ClusterStatus.DISABLED)
+        .annotate(n_pending_votes=F("conversation__vote_sequence") - F("model_watermark"))
+        .filter(n_pending_votes__gte=UNPROCESSED_VOTES_FOR_UPDATE)
+        .order_by("-n_pending_votes", "update_requested")
+    )
+
+
+def dispatch(limit=None, time=None, send=None):
+    """
+    Send due clusterizations to the update actor, most urgent first.
+
+    Args:
+        limit:
+            Maximum number of updates dispatched.
+        time:
+            Reference time used to check the cooldown (defaults to now).
+        send:
+            Function called with the clusterization id for each dispatched
+            update. The default sends a message to the dramatiq actor, which
+            requires EJ_CLUSTERS_BROKER_URL; use :func:`update` to run updates
+            in the current process.
+
+    Returns:
+        List of dispatched clusterization ids.
+    """
+    if send is None:
+        if tasks.broker_url() is None:
+            raise ImproperlyConfigured(
+                "EJ_CLUSTERS_BROKER_URL must be set to send clusterization updates"
+            )
+        send = tasks.update_clusterization.send
+
+    ids = list(due_clusterizations(time).values_list("id", flat=True)[:limit])
+    if not ids:
+        return ids
+
+    # Requests are cleared only after they were sent, hence updates that
+    # could not be sent are retried in the next round
+    sent = []
+    try:
+        for id in ids:
+            send(id)
+            sent.append(id)
+    finally:
+        Clusterization.objects.filter(id__in=sent).update(update_requested=None)
+    log.info(f"[clusters] scheduled {len(sent)} clusterization update(s)")
+    return sent
+
+
+def update(id):
+    """
+    Update clusterization with the given id.
+
+    :func:`dispatch` already checked the cooldown and the number of unprocessed
+    votes, hence these rules are skipped. Clusterizations that are disabled or
+    still do not have enough data to be activated are not updated (see
+    :func:`can_update`).
+    """
+    clusterization = Clusterization.objects.filter(id=id).first()
+    if clusterization is None or not can_update(clusterization):
+        return False
+    return clusterization.update_clusterization(force=True)
+
+
+def can_update(clusterization):
+    """
+    Return True if the clusterization is enabled and, if it is still pending
+    data, passes the 'ej.can_activate_clusterization' rule.
+    """
+    status = clusterization.cluster_status
+    if status == ClusterStatus.DISABLED:
+        return False
+    elif status == ClusterStatus.PENDING_DATA:
+        if not rules.test_rule("ej.can_activate_clusterization", clusterization):
+            log.info(f"[clusters] {clusterization}: not enough data to activate")
+            return False
+    return True
+
+
+class UpdateTimeout(Exception):
+    """
+    Raised when an update takes longer than the timeout given to
+    :func:`update_many`.
+    """
+
+
+def update_many(ids, n_jobs=1, timeout=None, warm_start=True, callback=None):
+    """
+    Update the clusterizations with the given ids in a pool of processes.
+
+    Updates skip the cooldown and the number of unprocessed votes, but not
+    the activation rules (see :func:`can_update`). They run in a transaction,
+    hence a failed or interrupted update keeps the last committed clusters.
+
+    Args:
+        ids:
+            Sequence of clusterization ids.
+        n_jobs (int):
+            Number of worker processes. If None or -1, uses one process per
+            CPU. The default (n_jobs=1) runs all updates in the current
+            process.
+        timeout (float):
+            Maximum duration of each update in seconds. Slower updates are
+            interrupted and reported as failures.
+        warm_start (bool):
+            Passed to :meth:`Clusterization.update_clusterization`.
+        callback:
+            Function called with the result of each update as soon as it
+            finishes.
+
+    Returns:
+        A list of results in the order updates finished. Each result is a
+        dictionary with the clusterization "id", a boolean "updated", which
+        is False if the last clusters were reused, the "duration" in seconds
+        and an "error" message, which is None for successful updates.
+    """
+    ids = list(ids)
+    if n_jobs is None or n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = max(1, min(n_jobs, len(ids)))
+    results = []
+
+    def register(result):
+        results.append(result)
+        if callback is not None:
+            callback(result)
+
+    if n_jobs == 1:
+        for id in ids:
+            register(_timed_update(id, timeout, warm_start))
+        return results
+
+    # Worker processes must open their own database connections instead of
+    # sharing the sockets inherited from this process
+    connections.close_all()
+    with futures.ProcessPoolExecutor(n_jobs) as executor:
+        pending = {
+            executor.submit(_timed_update, id, timeout, warm_start): id for id in ids
+        }
+        for future in futures.as_completed(pending):
+            try:
+                register(future.result())
+            except Exception as exc:
+                # The worker process died before returning a result
+                register(_result(pending[future], error=f"{type(exc).__name__}: {exc}"))
+    return results
+
+
+def _timed_update(id, timeout=None, warm_start=True):
+    # Update clusterization, interrupting it with UpdateTimeout after the
+    # given number of seconds. Return a result dict as in update_many().
+    def interrupt(signum, frame):
+        raise UpdateTimeout(f"update took longer than {timeout} seconds")
+
+    start = perf_counter()
+    if timeout:
+        handler = signal.signal(signal.SIGALRM, interrupt)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        clusterization = Clusterization.objects.filter(id=id).first()
+        if clusterization is None:
+            return _result(id, error="clusterization does not exist")
+        if not can_update(clusterization):
+            return _result(id, duration=perf_counter() - start)
+        updated = clusterization.update_clusterization(
+            force=True, atomic=True, warm_start=warm_start
+        )
+    except Exception as exc:
+        log.exception(f"[clusters] error updating clusterization {id}")
+        error = f"{type(exc).__name__}: {exc}"
+        return _result(id, duration=perf_counter() - start, error=error)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, handler)
+    return _result(id, updated, perf_counter() - start)
+
+
+def _result(id, updated=False, duration=None, error=None):
+    return {"id": id, "updated": updated, "duration": duration, "error": error}
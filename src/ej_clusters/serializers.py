@@ -38,7 +38,7 @@ class ClusterSerializer(BaseApiSerializer):
         return list(cluster.users.all().values_list("id", flat=True))
 
     def get_positive_comments(self, cluster):
-        top5_positive_comments = cluster.separate_comments()[0][0:5]
+        top5_positive_comments = self.separated_comments(cluster)[0][0:5]
         return list(
             map(
                 lambda comment: dict([(comment.agree, comment.content)]),
@@ -46,8 +46,21 @@ class ClusterSerializer(BaseApiSerializer):
             )
         )
 
+    def separated_comments(self, cluster):
+        """
+        Return the (agree, disagree) comments of the cluster.
+
+        Comments of all clusters are computed once per clusterization with
+        the cached :meth:`Clusterization.separated_comments`.
+        """
+        separated = self.__dict__.setdefault("_separated_comments", {})
+        clusterization = cluster.clusterization
+        if clusterization.id not in separated:
+            separated[clusterization.id] = clusterization.separated_comments()
+        return separated[clusterization.id].get(cluster.id, ([], []))
+
     def get_negative_comments(self, cluster):
-        top5_negative_comments = cluster.separate_comments()[1][0:5]
+        top5_negative_comments = self.separated_comments(cluster)[1][0:5]
         return list(
             map(
                 lambda comment: dict([(comment.disagree, comment.content)]),
@@ -62,7 +75,7 @@ class ClusterizationSerializer(BaseApiSerializer):
 
     class Meta:
         model = Clusterization
-        fields = ["links", "conversation", "cluster_status"]
+        fields = ["links", "conversation", "cluster_status", "model_stats"]
 
     def get_links(self, obj):
         return {
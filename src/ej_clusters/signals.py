@@ -0,0 +1,28 @@
+from logging import getLogger
+
+from django.dispatch import receiver
+
+from ej_conversations.signals import vote_cast
+
+log = getLogger("ej")
+
+
+@receiver(vote_cast, dispatch_uid="ej_clusters_assign_voter")
+def assign_voter_to_cluster(sender, vote, comment, **kwargs):
+    """
+    Move the voter to the closest cluster of the last clusterization.
+
+    Full re-clusterizations still run periodically to correct drift of the
+    centroids.
+    """
+    clusterization = comment.conversation.get_clusterization(default=None)
+    if clusterization is None or not clusterization.model_data:
+        return
+
+    try:
+        clusterization.assign_user(vote.author)
+    except Exception as exc:
+        exc_name = exc.__class__.__name__
+        log.error(
+            f"[clusters] Error assigning {vote.author} to cluster: {exc} ({exc_name})"
+        )
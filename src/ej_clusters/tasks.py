@@ -1,14 +1,71 @@
 import dramatiq
+from django.conf import settings
+from dramatiq.brokers.stub import StubBroker
 
-from .models import Clusterization
+from . import scheduler
 
 
-@dramatiq.actor
+def make_broker():
+    """
+    Return a Redis broker if EJ_CLUSTERS_BROKER_URL is set. Otherwise, return
+    a StubBroker, which keeps messages in memory until they are processed by
+    :func:`run_worker`.
+
+    The broker is not installed as the global dramatiq broker. Start workers
+    with ``dramatiq ej_clusters.tasks:broker``.
+    """
+    url = broker_url()
+    if url:
+        from dramatiq.brokers.redis import RedisBroker
+
+        return RedisBroker(url=url)
+    return StubBroker()
+
+
+def broker_url():
+    """
+    Return the value of EJ_CLUSTERS_BROKER_URL, or None if it is not set.
+    """
+    return getattr(settings, "EJ_CLUSTERS_BROKER_URL", None) or None
+
+
+broker = make_broker()
+
+
+@dramatiq.actor(broker=broker)
 def update_clusterization(id):
     """
     Task that fetches a clusterization with the given id and executes it's
     .update_clusterization() method.
     """
-    clusterization = Clusterization.objects.filter(id=id).first()
-    if clusterization is not None:
-        clusterization.update_clusterization()
+    scheduler.update(id)
+
+
+def use_stub_broker():
+    """
+    Move actors to an in-memory StubBroker, so messages can be processed by
+    :func:`run_worker` without an external message queue.
+    """
+    global broker
+
+    if not isinstance(broker, StubBroker):
+        broker = StubBroker()
+        update_clusterization.broker = broker
+        broker.declare_actor(update_clusterization)
+    return broker
+
+
+def run_worker(timeout=None):
+    """
+    Process all messages enqueued in the StubBroker in the current process.
+    """
+    if not isinstance(broker, StubBroker):
+        raise RuntimeError("run_worker() requires a StubBroker")
+
+    worker = dramatiq.Worker(broker, worker_threads=1)
+    worker.start()
+    try:
+        broker.join(update_clusterization.queue_name, fail_fast=True, timeout=timeout)
+        worker.join()
+    finally:
+        worker.stop()
@@ -0,0 +1,47 @@
+import json
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+
+from ej_clusters import benchmark
+from ej_conversations.models import Conversation
+
+
+def test_synthetic_votes_follow_group_profiles():
+    centers = np.array([[1.0, -1.0], [-1.0, 1.0]])
+    labels = np.repeat([0, 1], 500)
+    users, comments, choices = benchmark.synthetic_votes(
+        labels, centers, missing=0.5, skip=0.0, seed=0
+    )
+    assert 0.4 < len(users) / labels.size / 2 < 0.6
+    agree = choices == 1
+    group = labels[users]
+    assert agree[(group == 0) & (comments == 0)].mean() > 0.8
+    assert agree[(group == 1) & (comments == 0)].mean() < 0.2
+
+
+@pytest.mark.django_db
+def test_benchmark_suite_writes_json_report(tmp_path):
+    output = tmp_path / "report.json"
+    call_command(
+        "benchmarkclusters",
+        users=[20],
+        comments=[5],
+        clusters=2,
+        output=str(output),
+        reference=True,
+    )
+    report = json.loads(output.read_text())
+
+    (result,) = report["results"]
+    assert (result["n_users"], result["n_comments"]) == (20, 5)
+    assert result["n_votes"] > 0
+    assert set(result["timings"]) == {
+        "votes_table",
+        "find_clusters",
+        "compute_cluster_affinities",
+        "separate_comments",
+        "reference_cluster_affinities",
+    }
+    assert not Conversation.objects.exists()
@@ -1,10 +1,15 @@
+import contextlib
+
 import pytest
 from numpy.testing import assert_almost_equal, assert_equal
 from sidekick import import_later
 
-from ej_clusters.math import kmeans
+from ej_clusters.benchmark import reference_cluster_affinities
+from ej_clusters.math import compute_cluster_affinities, kmeans
 
 np = import_later("numpy")
+pd = import_later("pandas")
+sparse = import_later("scipy.sparse")
 
 # A very easy dataset with k=2
 STEREOTYPES = np.array([[1, 1, 1], [-1, -1, -1]], dtype=float)
@@ -12,6 +17,18 @@ DATA = np.array(
     [[1, 0, 1], [1, 1, 1], [0, 1, 1], [-1, 0, -1], [-1, -1, 0], [-1, -1, -1]], dtype=float
 )
 
+# Votes with NaN as missing values
+MASKED_VOTES = np.array(
+    [
+        [1, -1, -1],
+        [-1, np.nan, np.nan],
+        [1, np.nan, 1],
+        [np.nan, np.nan, -1],
+        [np.nan, -1, np.nan],
+        [-1, np.nan, 1],
+    ]
+)
+
 
 class TestAuxiliaryMathFunctions:
     @pytest.fixture
@@ -48,6 +65,50 @@ class TestAuxiliaryMathFunctions:
         expected = [[2 / 3, 2 / 3, 1], [-1, -2 / 3, -2 / 3]]
         assert_almost_equal(centroids, expected)
 
+    def test_mean_finite_aggregator_ignores_missing_values(self):
+        data = np.array([[1, np.nan, 0], [0, np.nan, -1], [1, 1, np.nan]])
+        expected = [2 / 3, 1, -1 / 2]
+        assert_almost_equal(kmeans.mean_finite_aggregator(data), expected)
+        data = kmeans.masked_to_sparse(data)
+        assert_almost_equal(kmeans.mean_finite_aggregator(data), expected)
+
+    @pytest.mark.parametrize("aggregator", ["mean", "mean-finite"])
+    def test_vectorized_centroids_match_aggregator(self, aggregator):
+        aggregator = kmeans.normalize_aggregator(aggregator)
+        data = DATA.copy()
+        data[::4, 1] = np.nan
+        labels = [0, 1, 2, 0, 1, 0]
+        expected = kmeans.compute_centroids(data, labels, 3, lambda x: aggregator(x))
+        assert_almost_equal(
+            kmeans.compute_centroids(data, labels, 3, aggregator), expected
+        )
+
+
+class TestDistanceMatrix:
+    @pytest.fixture
+    def data(self):
+        data = np.random.RandomState(0).randint(-1, 2, size=(50, 3)).astype(float)
+        data[::5, 2] = float("nan")
+        return data
+
+    @pytest.mark.parametrize(
+        "name", ["euclidean", "euclidean-non-zero", "euclidean-finite", "l1"]
+    )
+    def test_vectorized_distances_match_pairwise_distances(self, data, name):
+        distance = kmeans.normalize_distance(name)
+        if name != "euclidean-finite":
+            data = np.nan_to_num(data)
+        expected = kmeans.compute_distance_matrix(data, DATA, lambda x, y: distance(x, y))
+        result = kmeans.compute_distance_matrix(data, DATA, distance, chunk_size=7)
+        assert_almost_equal(result, expected)
+
+    def test_masked_distance_ignores_entries_not_stored_in_sparse_data(self, data):
+        distance = kmeans.euclidean_distance_finite
+        expected = kmeans.compute_distance_matrix(data, DATA, distance)
+        data = kmeans.masked_to_sparse(data)
+        result = kmeans.compute_distance_matrix(data, DATA, distance, chunk_size=7)
+        assert_almost_equal(result, expected)
+
 
 class TestKmeansWithStereotypes:
     def test_run_with_stereotypes(self):
@@ -59,6 +120,82 @@ class TestKmeansWithStereotypes:
         labels, clusters = kmeans.kmeans_stereotypes(DATA, STEREOTYPES, max_iter=1)
         assert_equal(labels, [0, 0, 0, 1, 1, 1])
 
+    def test_kmeans_warm_start_converges_in_one_iteration(self):
+        labels, centroids = kmeans.kmeans_stereotypes(DATA, STEREOTYPES)
+        result = kmeans.kmeans_stereotypes(
+            DATA,
+            STEREOTYPES,
+            init_centroids=centroids,
+            init_labels=labels,
+            return_n_iter=True,
+        )
+        assert_equal(result[0], labels)
+        assert_almost_equal(result[1], centroids)
+        assert result[2] == 1
+
+    def test_kmeans_warm_start_recomputes_centroids_of_stable_labels(self):
+        labels, centroids = kmeans.kmeans_stereotypes(DATA, STEREOTYPES)
+        data = DATA.copy()
+        data[:3, 2] = 0.0
+        result = kmeans.kmeans_stereotypes(
+            data,
+            STEREOTYPES,
+            init_centroids=centroids,
+            init_labels=labels,
+            return_n_iter=True,
+        )
+        assert_equal(result[0], labels)
+        assert result[2] == 1
+        expected = kmeans.compute_centroids(
+            np.vstack([data, STEREOTYPES]), np.append(labels, [0, 1]), 2
+        )
+        assert_almost_equal(result[1], expected)
+        assert_almost_equal(result[1][0], [0.75, 0.75, 0.25])
+
+    def test_kmeans_with_sparse_data(self):
+        data = sparse.csr_matrix(DATA)
+        labels, centroids = kmeans.kmeans_stereotypes(data, STEREOTYPES)
+        assert_equal(labels, [0, 0, 0, 1, 1, 1])
+        _, expected = kmeans.kmeans_stereotypes(DATA, STEREOTYPES)
+        assert_almost_equal(centroids, expected)
+
+    def test_kmeans_with_masked_sparse_data(self):
+        from ej_clusters.math.kmeans_sklearn import StereotypeKMeans
+
+        data = DATA.copy()
+        data[data == 0] = np.nan
+        args = dict(distance="euclidean-finite", aggregator="mean-finite")
+        model = StereotypeKMeans(2, **args)
+        labels = model.fit_predict(
+            kmeans.masked_to_sparse(np.vstack([data, STEREOTYPES]))
+        )
+        assert_equal(labels, [0, 0, 0, 1, 1, 1, 0, 1])
+        expected = StereotypeKMeans(2, **args).fit(np.vstack([data, STEREOTYPES]))
+        assert_almost_equal(model.cluster_centers_, expected.cluster_centers_)
+
+    def test_minibatch_kmeans_matches_full_batch_centroids(self):
+        labels, centroids = kmeans.kmeans_stereotypes_minibatch(
+            sparse.csr_matrix(DATA), STEREOTYPES, batch_size=2
+        )
+        assert_equal(labels, [0, 0, 0, 1, 1, 1])
+        _, expected = kmeans.kmeans_stereotypes(DATA, STEREOTYPES)
+        assert_almost_equal(centroids, expected)
+
+    def test_minibatch_partial_fit_streams_chunks(self):
+        from ej_clusters.math.kmeans_sklearn import MiniBatchStereotypeKMeans
+
+        model = MiniBatchStereotypeKMeans(2, batch_size=2)
+        for chunk in (DATA[:4], DATA[4:]):
+            model.partial_fit(np.vstack([chunk, STEREOTYPES]))
+        assert model.n_iter_ == 2
+        assert_equal(model.labels_, [1, 1, 0, 1])
+        assert_equal(model.predict(DATA), [0, 0, 0, 1, 1, 1])
+
+        # Stereotypes are included once for each chunk
+        sums = [DATA[:3].sum(axis=0), DATA[3:].sum(axis=0)]
+        expected = (np.array(sums) + 2 * STEREOTYPES) / 5
+        assert_almost_equal(model.cluster_centers_, expected)
+
     def test_kmeans_with_missing_data(self):
         distance = kmeans.euclidean_distance_non_zero
         labels, clusters = kmeans.kmeans_stereotypes(DATA, STEREOTYPES, distance=distance)
@@ -85,7 +222,160 @@ class TestKmeans:
         assert_equal(labels, range(len(DATA)))
         assert_equal(clusters, DATA)
 
-    def test_kmeans_convergence(self):
-        # If no guidance is given, convergence is unlikely to happen
-        labels, clusters = kmeans.kmeans(DATA, 2, max_iter=1, n_runs=2)
-        assert (labels != [0, 0, 0, 1, 1, 1]).any()
+    def test_kmeans_with_parallel_runs(self):
+        for backend in ["thread", "process"]:
+            labels, _centroids = kmeans.kmeans(
+                DATA, 2, n_runs=4, n_jobs=2, backend=backend
+            )
+            labels = list(labels)
+            assert labels == [0, 0, 0, 1, 1, 1] or labels == [1, 1, 1, 0, 0, 0]
+
+    def test_vq_uses_distance_matrix(self):
+        labels = np.array([0, 0, 1, 1, 1, 0])
+        distance = kmeans.l1_distance
+        expected = sum(
+            distance(STEREOTYPES[k], sample) ** 2 for k, sample in zip(labels, DATA)
+        )
+        distances = kmeans.compute_distance_matrix(DATA, STEREOTYPES, distance)
+        assert_almost_equal(kmeans.vq(DATA, labels, STEREOTYPES, distance), expected)
+        assert_almost_equal(
+            kmeans.vq(None, labels, STEREOTYPES, distances=distances), expected
+        )
+
+    def test_kmeans_run_returns_distances_to_final_centroids(self):
+        for max_iter in (1, 10):
+            labels, centroids, distances = kmeans.kmeans_run(
+                DATA, 2, max_iter=max_iter, return_distances=True
+            )
+            expected = kmeans.compute_distance_matrix(DATA, centroids)
+            assert_almost_equal(distances, expected)
+
+    def test_stereotype_kmeans_score(self):
+        from ej_clusters.math.kmeans_sklearn import StereotypeKMeans
+
+        model = StereotypeKMeans(2).fit(np.vstack([DATA, STEREOTYPES]))
+        labels = model.predict(DATA)
+        expected = -kmeans.vq(DATA, labels, model.cluster_centers_)
+        assert_almost_equal(model.score(DATA), expected)
+        distances = kmeans.compute_distance_matrix(DATA, model.cluster_centers_)
+        assert_almost_equal(model.score(DATA, squared=False), -distances.min(1).sum())
+
+    def test_kmeanspp_selects_k_distinct_samples(self):
+        centroids = kmeans.init_kmeanspp(DATA, 2)
+        assert centroids.shape == (2, 3)
+        assert len({tuple(c) for c in centroids}) == 2
+        assert all((DATA == c).all(axis=1).any() for c in centroids)
+
+    def test_worker_stops_when_objective_plateaus(self):
+        calls = []
+
+        def func():
+            calls.append(1)
+            return len(calls)
+
+        result = kmeans.worker(10, lambda x: min(x, 2), func, patience=3)
+        assert result == 2
+        assert len(calls) == 5
+
+
+class TestClusterModel:
+    def test_model_reproduces_pipeline_labels(self):
+        from ej_clusters.math import ClusterModel, clusterization_pipeline
+
+        data = np.vstack([DATA, STEREOTYPES])
+        pipeline = clusterization_pipeline()(2)
+        labels = pipeline.fit_predict(data)
+        model = ClusterModel.from_pipeline(pipeline, [10, 20], [1, 2, 3], data)
+        model = ClusterModel.from_json(model.to_json())
+
+        votes = pd.DataFrame(data, columns=[1, 2, 3])
+        assert_equal(model.predict(model.transform(votes)), np.array([10, 20])[labels])
+        assert model.predict(model.transform_votes([(1, -1), (3, -1)]))[0] == 20
+        assert model.project(model.transform(votes)).shape == (8, 2)
+
+    def test_masked_model_ignores_missing_votes(self):
+        from ej_clusters.math import ClusterModel, clusterization_pipeline
+
+        # Filling missing votes with the mean assigns some of these users to
+        # different clusters
+        data = np.vstack([MASKED_VOTES, STEREOTYPES])
+        pipeline = clusterization_pipeline(masked=True)(2)
+        labels = pipeline.fit_predict(kmeans.masked_to_sparse(data))
+        model = ClusterModel.from_pipeline(pipeline, [10, 20], [1, 2, 3])
+        model = ClusterModel.from_json(model.to_json())
+        assert model.masked
+
+        for row, label in zip(data, labels):
+            votes = [(c, v) for c, v in zip([1, 2, 3], row) if not np.isnan(v)]
+            assert model.predict(model.transform_votes(votes))[0] == [10, 20][label]
+
+    def test_fit_predict_stages_records_each_step(self):
+        from ej_clusters.math import clusterization_pipeline, fit_predict_stages
+
+        class Stats:
+            stages = []
+
+            @contextlib.contextmanager
+            def stage(self, name):
+                yield
+                self.stages.append(name)
+
+        data = np.vstack([DATA, STEREOTYPES])
+        expected = clusterization_pipeline()(2).fit_predict(data)
+        stats = Stats()
+        labels = fit_predict_stages(clusterization_pipeline()(2), data, stats)
+        assert_equal(labels, expected)
+        assert stats.stages == ["scale", "whiten", "clusterize"]
+
+    def test_clusterization_pipeline_selects_minibatch_kmeans(self):
+        from ej_clusters.math import clusterization_pipeline
+        from ej_clusters.math.kmeans_sklearn import MiniBatchStereotypeKMeans
+
+        pipeline = clusterization_pipeline(batch_size=2)(2)
+        assert isinstance(pipeline.steps[-1][1], MiniBatchStereotypeKMeans)
+        labels = pipeline.fit_predict(np.vstack([DATA, STEREOTYPES]))
+        assert_equal(labels, [0, 0, 0, 1, 1, 1, 0, 1])
+
+    def test_mean_imputer_scaler_keeps_compact_dtypes(self):
+        from ej_clusters.math.pipeline import MeanImputerScaler
+
+        data = sparse.csr_matrix(DATA.astype("int8"))
+        scaler = MeanImputerScaler().fit(data)
+        assert scaler.transform(data).dtype == np.float32
+        assert scaler.transform(DATA.astype("float32")).dtype == np.float32
+        expected = scaler.transform(sparse.csr_matrix(DATA))
+        assert_almost_equal(scaler.transform(data).toarray(), expected.toarray())
+
+
+class TestClusterAffinities:
+    @pytest.fixture
+    def votes(self):
+        rng = np.random.RandomState(0)
+        centers = rng.choice([-1.0, 0.0, 1.0], size=(4, 20))
+        labels = rng.randint(0, 4, size=1000)
+        data = np.clip(centers[labels] + rng.normal(0, 0.5, (1000, 20)), -1, 1)
+        votes = pd.DataFrame(data, columns=[f"c{i}" for i in range(20)])
+        votes["cluster"] = labels * 10 + 1
+        return votes
+
+    def test_matches_reference_implementation(self, votes):
+        expected = reference_cluster_affinities(votes)
+        result = compute_cluster_affinities(votes)
+        assert list(result) == list(expected)
+        for k, shape in expected.items():
+            assert result[k]["size"] == shape["size"]
+            assert set(result[k]["intersections"]) == set(shape["intersections"])
+            for k_, value in shape["intersections"].items():
+                assert_almost_equal(result[k]["intersections"][k_], value)
+
+    def test_accepts_compact_dtypes(self, votes):
+        expected = compute_cluster_affinities(votes)
+        compact = votes.astype({c: "float32" for c in votes.columns[:-1]})
+        result = compute_cluster_affinities(compact)
+        for k, shape in expected.items():
+            for k_, value in shape["intersections"].items():
+                assert_almost_equal(result[k]["intersections"][k_], value, decimal=4)
+
+        choices = votes.round().astype({c: "int8" for c in votes.columns[:-1]})
+        result = compute_cluster_affinities(choices)
+        assert sum(shape["size"] for shape in result.values()) == len(votes)
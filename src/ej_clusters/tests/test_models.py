@@ -1,5 +1,15 @@
 import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.utils.timezone import now, timedelta
+from ej_clusters import rules
+from ej_clusters.enums import ClusterStatus
+from ej_clusters.models import Cluster, Clusterization, Stereotype, StereotypeVote
+from ej_clusters.models.cluster_queryset import ClusterQuerySet
 from ej_clusters.mommy_recipes import ClusterRecipes
+from ej_clusters.utils import cache_stats, get_or_set, single_flight
+from ej_conversations.enums import Choice
+from ej_users.models import User
 from ej_conversations.tests.test_views import ConversationSetup
 
 
@@ -58,3 +68,275 @@ class TestCluster(ConversationSetup):
         clusterization = conversation_without_votes.get_clusterization()
         clusterization.update_clusterization(force=True)
         assert clusterization.stereotype_votes.count() == 0
+
+    def test_update_consumes_unprocessed_votes(self, clusterization, cluster, vote):
+        assert clusterization.n_unprocessed_votes == 1
+        clusterization.update_clusterization(force=True)
+        assert clusterization.n_unprocessed_votes == 0
+
+    def test_update_stores_pipeline_stats(self, clusterization, cluster, vote):
+        clusterization.update_clusterization(force=True)
+        stats = clusterization.model_stats
+        stages = [stage["name"] for stage in stats["stages"]]
+        assert stages[:2] == ["fingerprint", "votes"]
+        assert {"clusterize", "save", "model"} <= set(stages)
+        assert stats["shape"] == [2, 1]
+        assert stats["n_iter"] is not None
+        assert clusterization.update_time == stats["time"]
+
+    def test_update_reuses_clusters_if_votes_did_not_change(
+        self, clusterization, cluster, vote
+    ):
+        clusterization.update_clusterization(force=True)
+        fingerprint = clusterization.model_fingerprint
+        assert fingerprint == clusterization.clusters.input_fingerprint()
+
+        hits = cache_stats("find_clusters")["hits"]
+        result = clusterization.clusters.find_clusters(fingerprint=fingerprint)
+        assert result.cached
+        assert list(result) == [cluster.id]
+        assert cache_stats("find_clusters")["hits"] == hits + 1
+
+        vote.comment.vote(User.objects.create_user("other@domain.com"), "disagree")
+        assert clusterization.clusters.input_fingerprint() != fingerprint
+
+    def test_find_clusters_only_writes_changed_memberships(
+        self, clusterization, cluster, vote
+    ):
+        result = clusterization.clusters.find_clusters()
+        assert (result.n_inserted, result.n_deleted) == (1, 0)
+        result = clusterization.clusters.find_clusters()
+        assert (result.n_inserted, result.n_deleted) == (0, 0)
+
+        cluster.users.remove(vote.author)
+        result = clusterization.clusters.find_clusters()
+        assert (result.n_inserted, result.n_deleted) == (1, 0)
+        assert list(cluster.users.all()) == [vote.author]
+
+    def test_separate_comments_for_all_clusters(self, clusterization, cluster, vote):
+        other = Cluster.objects.create(clusterization=clusterization, name="Other")
+        voter = User.objects.create_user("voter@domain.com")
+        vote.comment.vote(voter, "disagree")
+        cluster.users.add(vote.author)
+        other.users.add(voter)
+
+        result = clusterization.clusters.separate_comments()
+        assert result[cluster.id][0] == [vote.comment]
+        assert result[cluster.id][1] == []
+        assert result[other.id][0] == []
+        assert result[other.id][1] == [vote.comment]
+        assert result[other.id][1][0].participation == 1.0
+        assert cluster.separate_comments() == result[cluster.id]
+
+    def test_cluster_map_uses_a_single_query(
+        self, clusterization, cluster, stereotype, django_assert_num_queries
+    ):
+        other = Cluster.objects.create(clusterization=clusterization, name="Other")
+        users = [User.objects.create_user(f"user{i}@domain.com") for i in range(3)]
+        cluster.users.add(users[0])
+        other.users.add(*users[1:])
+
+        clusters = clusterization.clusters.all()
+        with django_assert_num_queries(1):
+            user_clusters = clusters.cluster_map()
+        assert user_clusters.dtype == "int64"
+        assert dict(user_clusters) == {
+            users[0].id: cluster.id,
+            users[1].id: other.id,
+            users[2].id: other.id,
+        }
+        assert dict(clusters.cluster_map("stereotypes")) == {stereotype.id: cluster.id}
+
+    def test_mean_stereotype_votes(
+        self, cluster, stereotype_vote, user, django_assert_num_queries
+    ):
+        comment = stereotype_vote.comment
+        other_comment = comment.conversation.create_comment(
+            user, "other comment", status="approved", check_limits=False
+        )
+        other = Stereotype.objects.create(name="other", owner=user)
+        cluster.stereotypes.add(other)
+        StereotypeVote.objects.create(
+            author=other, comment=other_comment, choice=Choice.DISAGREE
+        )
+
+        clusters = Cluster.objects.filter(id=cluster.id)
+        with django_assert_num_queries(1):
+            votes = clusters.mean_stereotype_votes()
+        assert votes.loc[cluster.id].to_dict() == {
+            comment.id: 1.0,
+            other_comment.id: -1.0,
+        }
+        votes = clusters.mean_stereotype_votes(fill_zero=True)
+        assert votes.loc[cluster.id].to_dict() == {
+            comment.id: 0.5,
+            other_comment.id: -0.5,
+        }
+        assert cluster.mean_stereotype()["choice"].to_dict() == {
+            comment.id: 1.0,
+            other_comment.id: -1.0,
+        }
+
+    def test_shapes_are_cached_until_next_clusterization(
+        self, clusterization, cluster, vote
+    ):
+        clusterization.update_clusterization(force=True)
+        key = clusterization.cache_key("affinities")
+        hits = cache_stats("affinities")["hits"]
+        shapes = clusterization.cluster_affinities()
+        assert clusterization.cluster_affinities() == shapes
+        assert cache_stats("affinities")["hits"] == hits + 1
+
+        # Reusing the current clusters keeps the cache
+        modified = clusterization.modified
+        assert clusterization.update_clusterization(force=True) is False
+        assert clusterization.cache_key("affinities") == key
+        clusterization.refresh_from_db()
+        assert clusterization.modified == modified
+        assert clusterization.cluster_affinities() == shapes
+        assert cache_stats("affinities")["hits"] == hits + 2
+
+        vote.comment.vote(User.objects.create_user("other@domain.com"), "disagree")
+        assert clusterization.update_clusterization(force=True) is True
+        assert clusterization.cache_key("affinities") != key
+
+
+class TestOnlineClusterAssignment:
+    @pytest.fixture
+    def model_data(self, clusterization, cluster, comment):
+        other = Cluster.objects.create(clusterization=clusterization, name="Other")
+        clusterization.model_data = {
+            "comments": [comment.id],
+            "clusters": [cluster.id, other.id],
+            "mean": [0.0],
+            "scale": [1.0],
+            "centroids": [[1.0], [-1.0]],
+        }
+        clusterization.save()
+        return clusterization
+
+    @pytest.fixture
+    def voter(self, db):
+        return User.objects.create_user("voter@domain.com", "password")
+
+    def test_vote_assigns_voter_to_closest_cluster(
+        self, model_data, cluster, comment, voter
+    ):
+        comment.vote(voter, "disagree")
+        other = model_data.clusters.get(name="Other")
+        assert list(other.users.all()) == [voter]
+        assert not cluster.users.filter(id=voter.id).exists()
+
+    def test_assign_user_moves_user_between_clusters(self, model_data, cluster, voter):
+        other = model_data.clusters.get(name="Other")
+        other.users.add(voter)
+        assert model_data.assign_user(voter) is None
+
+        model_data.conversation.comments.first().vote(voter, "agree")
+        assert list(cluster.users.all()) == [voter]
+        assert not other.users.filter(id=voter.id).exists()
+
+    def test_predict_user_matches_masked_clusterization(
+        self, clusterization, cluster, stereotype, comment
+    ):
+        conversation = clusterization.conversation
+        comments = [comment] + [
+            conversation.create_comment(
+                conversation.author, f"comment {i}", status="approved", check_limits=False
+            )
+            for i in range(2)
+        ]
+        other = Cluster.objects.create(clusterization=clusterization, name="Other")
+        other_stereotype = Stereotype.objects.create(name="other", owner=stereotype.owner)
+        other.stereotypes.add(other_stereotype)
+        for c in comments:
+            StereotypeVote.objects.create(
+                author=stereotype, comment=c, choice=Choice.AGREE
+            )
+            StereotypeVote.objects.create(
+                author=other_stereotype, comment=c, choice=Choice.DISAGREE
+            )
+
+        # Filling missing votes with the mean assigns some of these users to
+        # different clusters
+        rows = [
+            (1, -1, -1),
+            (-1, None, None),
+            (1, None, 1),
+            (None, None, -1),
+            (None, -1, None),
+            (-1, None, 1),
+        ]
+        users = [
+            User.objects.create_user(f"voter{i}@domain.com") for i in range(len(rows))
+        ]
+        for user, row in zip(users, rows):
+            for c, choice in zip(comments, row):
+                if choice is not None:
+                    c.vote(user, Choice(choice))
+
+        result = clusterization.clusters.find_clusters(masked=True)
+        clusterization.model_data = result.model.to_json()
+        clusterization.save()
+        for user in users:
+            cluster_id = user.clusters.get(clusterization=clusterization).id
+            assert clusterization.predict_user(user) == cluster_id
+
+
+class TestClusterizationUpdateLock:
+    def test_single_flight_lock_is_exclusive(self):
+        with single_flight("test-lock", backend="cache") as first:
+            with single_flight("test-lock", backend="cache") as second:
+                assert first
+                assert not second
+        with single_flight("test-lock", backend="cache") as again:
+            assert again
+
+    def test_update_is_skipped_while_lock_is_held(self, clusterization, cluster, vote):
+        if connection.vendor == "postgresql":
+            pytest.skip("advisory locks are reentrant within the same connection")
+        with single_flight(clusterization.update_lock_key):
+            assert clusterization.update_clusterization(force=True) is False
+        assert clusterization.update_clusterization(force=True) is True
+
+    def test_update_rechecks_watermark_after_lock(
+        self, clusterization, cluster, vote, monkeypatch
+    ):
+        monkeypatch.setattr(rules, "UNPROCESSED_VOTES_FOR_UPDATE", 1)
+        clusterization.cluster_status = ClusterStatus.ACTIVE
+        clusterization.save()
+        Clusterization.objects.filter(id=clusterization.id).update(
+            modified=now() - timedelta(hours=1)
+        )
+        stale = Clusterization.objects.get(id=clusterization.id)
+        assert stale.n_unprocessed_votes >= 1
+
+        # Another process consumed the votes while this one waited for the lock
+        Clusterization.objects.filter(id=clusterization.id).update(
+            model_watermark=stale.vote_watermark
+        )
+        monkeypatch.setattr(
+            ClusterQuerySet, "find_clusters", lambda *args, **kw: pytest.fail()
+        )
+        assert stale.update_clusterization() is False
+        assert stale.n_unprocessed_votes == 0
+
+
+class TestCacheHelpers:
+    def test_get_or_set_only_computes_missing_values(self):
+        calls = []
+
+        def default():
+            calls.append(1)
+            return 42
+
+        cache.delete("test-key")
+        assert get_or_set("test-key", default) == 42
+        assert get_or_set("test-key", default) == 42
+        assert calls == [1]
+
+    def test_get_or_set_does_not_store_value_while_lock_is_held(self):
+        cache.delete("test-key")
+        with single_flight("test-key:lock", backend="cache"):
+            assert get_or_set("test-key", lambda: 42, wait=0) == 42
+        assert cache.get("test-key") is None
@@ -0,0 +1,106 @@
+import io
+import time
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.utils.timezone import now, timedelta
+
+from ej_clusters import scheduler
+from ej_clusters.enums import ClusterStatus
+from ej_clusters.models import Clusterization
+from ej_clusters.rules import COOLDOWN_TIME
+
+
+class TestScheduler:
+    @pytest.fixture
+    def pending(self, clusterization, vote, monkeypatch):
+        monkeypatch.setattr(scheduler, "UNPROCESSED_VOTES_FOR_UPDATE", 1)
+        Clusterization.objects.filter(id=clusterization.id).update(
+            modified=now() - timedelta(hours=1)
+        )
+        scheduler.request_update(clusterization)
+        return clusterization
+
+    def test_repeated_requests_are_coalesced(self, clusterization):
+        assert scheduler.request_update(clusterization) is True
+        requested = Clusterization.objects.get(id=clusterization.id).update_requested
+        assert scheduler.request_update(clusterization) is False
+        clusterization.refresh_from_db()
+        assert clusterization.update_requested == requested
+
+    def test_request_does_not_reset_cooldown(self, clusterization):
+        modified = clusterization.modified
+        scheduler.request_update(clusterization)
+        clusterization.refresh_from_db()
+        assert clusterization.modified == modified
+
+    def test_respects_cooldown(self, pending):
+        pending.refresh_from_db()
+        assert list(scheduler.due_clusterizations()) == [pending]
+        early = pending.modified + COOLDOWN_TIME - timedelta(seconds=1)
+        assert not scheduler.due_clusterizations(early).exists()
+
+    def test_dispatch_sends_each_clusterization_once(self, pending):
+        sent = []
+        assert scheduler.dispatch(send=sent.append) == [pending.id]
+        assert sent == [pending.id]
+        assert scheduler.dispatch(send=sent.append) == []
+        pending.refresh_from_db()
+        assert pending.update_requested is None
+
+    def test_dispatch_keeps_requests_that_were_not_sent(self, pending):
+        def send(id):
+            raise ConnectionError("broker is down")
+
+        with pytest.raises(ConnectionError):
+            scheduler.dispatch(send=send)
+        assert list(scheduler.due_clusterizations()) == [pending]
+
+    def test_dispatch_requires_a_broker(self, pending, settings):
+        settings.EJ_CLUSTERS_BROKER_URL = None
+        with pytest.raises(ImproperlyConfigured):
+            scheduler.dispatch()
+        assert list(scheduler.due_clusterizations()) == [pending]
+
+    def test_update_does_not_activate_clusterization_without_data(self, pending):
+        scheduler.dispatch(send=scheduler.update)
+        pending.refresh_from_db()
+        assert pending.cluster_status == ClusterStatus.PENDING_DATA
+        assert pending.model_data is None
+
+
+class TestUpdateMany:
+    @pytest.fixture
+    def active(self, clusterization, cluster, vote):
+        clusterization.cluster_status = ClusterStatus.ACTIVE
+        clusterization.save()
+        return clusterization
+
+    def test_reports_updates_and_failures(self, active):
+        results = scheduler.update_many([active.id, -1])
+        assert [(r["id"], r["updated"]) for r in results] == [
+            (active.id, True),
+            (-1, False),
+        ]
+        assert results[0]["error"] is None
+        assert results[1]["error"] == "clusterization does not exist"
+
+    def test_interrupts_slow_updates(self, active, monkeypatch):
+        monkeypatch.setattr(
+            Clusterization, "update_clusterization", lambda *args, **kw: time.sleep(1)
+        )
+        (result,) = scheduler.update_many([active.id], timeout=0.05)
+        assert result["error"].startswith("UpdateTimeout")
+        assert result["duration"] < 1
+
+    def test_skips_clusterizations_without_data(self, clusterization, cluster, vote):
+        (result,) = scheduler.update_many([clusterization.id])
+        assert (result["updated"], result["error"]) == (False, None)
+
+    def test_command_writes_summary(self, active):
+        out = io.StringIO()
+        call_command("updateclusterizations", all=True, stdout=out)
+        output = out.getvalue()
+        assert "[1/1]" in output
+        assert "1 clusterization(s): 1 updated, 0 unchanged, 0 failed" in output
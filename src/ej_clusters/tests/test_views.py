@@ -455,6 +455,18 @@ class TestClusterIndex(ConversationSetup, ClusterRecipes):
         assert response.status_code == 200
         assert b"the graph will be generated and displayed here after" in response.content
 
+    def test_cluster_index_requests_update_in_background(self, conversation_db, admin_db):
+        clusterization = conversation_db.get_clusterization()
+        url = reverse("boards:cluster-index", kwargs=conversation_db.get_url_kwargs())
+        client = Client()
+        client.force_login(admin_db)
+        response = client.get(url)
+
+        assert response.status_code == 200
+        clusterization.refresh_from_db()
+        assert clusterization.update_requested is not None
+        assert clusterization.model_version == 0
+
     def test_cluster_without_permission(self, conversation_db, base_user):
         conversation_db.get_clusterization()
         url = reverse("boards:cluster-index", kwargs=conversation_db.get_url_kwargs())
@@ -1,10 +1,28 @@
 import contextlib
+import sys
+import time
+import tracemalloc
+import uuid
+import zlib
+from logging import getLogger
 
 import sidekick as sk
-from django.db import transaction
+from django.core.cache import cache
+from django.db import connection, transaction
 
 from ej_clusters.math import compute_cluster_affinities
 
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+log = getLogger("ej")
+LOCK_TIMEOUT = 10 * 60
+CACHE_TIMEOUT = 24 * 60 * 60
+CACHE_WAIT = 30
+NOT_FOUND = object()
+
 
 @contextlib.contextmanager
 def use_transaction(which=None, **kwargs):
@@ -32,6 +50,235 @@ def use_transaction(which=None, **kwargs):
             yield handler
 
 
+@contextlib.contextmanager
+def single_flight(key, backend=None, timeout=LOCK_TIMEOUT):
+    """
+    Context manager that tries to acquire a lock shared by all processes and
+    yields True if it succeeds or False if the lock is held by someone else.
+    It never blocks waiting for the lock.
+
+    Args:
+        key (str):
+            Lock name.
+        backend ({'db', 'cache', None}):
+            The 'db' backend uses a PostgreSQL transaction-level advisory
+            lock, hence the block runs inside a transaction and the lock is
+            released on commit. The 'cache' backend uses an atomic cache.add()
+            and requires a cache shared by all processes to work across
+            workers. By default, it uses 'db' on PostgreSQL and 'cache'
+            otherwise.
+        timeout (int):
+            Expiration time in seconds for the 'cache' backend, used to recover
+            from processes that died holding the lock.
+    """
+    if backend is None:
+        backend = "db" if connection.vendor == "postgresql" else "cache"
+
+    if backend == "db":
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_try_advisory_xact_lock(%s)", [zlib.crc32(key.encode())]
+            )
+            acquired = cursor.fetchone()[0]
+            yield acquired
+    elif backend == "cache":
+        token = uuid.uuid4().hex
+        acquired = cache.add(key, token, timeout)
+        try:
+            yield acquired
+        finally:
+            if acquired and cache.get(key) == token:
+                cache.delete(key)
+    else:
+        raise ValueError(f"invalid backend: {backend}")
+
+
+def get_or_set(key, default, timeout=CACHE_TIMEOUT, stats=None, wait=CACHE_WAIT):
+    """
+    Like Django's cache.get_or_set(), but default must be a callable that is
+    only called on cache misses.
+
+    Only one caller computes a missing value at a time. Concurrent callers wait
+    up to ``wait`` seconds for the value to be stored and compute it themselves
+    (without storing) if it takes longer.
+
+    Args:
+        key (str):
+            Cache key. It should embed the version of the data used to compute
+            the value, e.g., with :meth:`Clusterization.cache_key`.
+        default (callable):
+            Function that computes the value.
+        timeout (int):
+            Cache expiration time in seconds.
+        stats (str):
+            If given, record hits and misses with :func:`record_cache_access`
+            using this name.
+        wait (float):
+            Maximum time in seconds waiting for a value computed by someone
+            else.
+    """
+    value = cache.get(key, NOT_FOUND)
+    if stats is not None:
+        record_cache_access(stats, value is not NOT_FOUND)
+    if value is not NOT_FOUND:
+        return value
+
+    deadline = time.monotonic() + wait
+    while True:
+        with single_flight(f"{key}:lock", backend="cache") as acquired:
+            if acquired:
+                value = cache.get(key, NOT_FOUND)
+                if value is NOT_FOUND:
+                    value = default()
+                    cache.set(key, value, timeout)
+                return value
+
+        if time.monotonic() > deadline:
+            return default()
+        time.sleep(0.05)
+        value = cache.get(key, NOT_FOUND)
+        if value is not NOT_FOUND:
+            return value
+
+
+def record_cache_access(name, hit):
+    """
+    Increment the hit or miss counter of the cache with the given name.
+
+    Counters are stored in the Django cache, hence they are shared by all
+    processes if the cache backend is.
+    """
+    key = f"ej_clusters.cache_stats:{name}:{'hits' if hit else 'misses'}"
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def cache_stats(name):
+    """
+    Return a dictionary with the number of hits and misses recorded by
+    :func:`record_cache_access` for the given cache.
+    """
+    prefix = f"ej_clusters.cache_stats:{name}"
+    return {
+        "hits": cache.get(f"{prefix}:hits", 0),
+        "misses": cache.get(f"{prefix}:misses", 0),
+    }
+
+
+def peak_memory():
+    """
+    Return the peak resident memory of the current process in bytes, or None
+    if it is not available in the current platform.
+
+    This is the highest memory usage since the process started, hence it
+    never decreases in long running workers.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS reports bytes
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+class PipelineStats:
+    """
+    Collect timings, memory usage and other statistics of the stages of a
+    clusterization.
+
+    Blocks wrapped in :meth:`stage` are timed and other values can be stored
+    with the item syntax, e.g., ``stats["shape"] = data.shape``.
+
+    Each stage records two memory measurements in bytes:
+
+    memory_growth:
+        How much the stage raised the peak resident memory of the process
+        (see :func:`peak_memory`). It is zero if the stage fits in memory the
+        process already used, which is common in long running workers.
+    peak_memory:
+        Peak memory allocated during the stage above the memory allocated
+        when it started. It is only measured while tracemalloc is tracing
+        (e.g., ``python -X tracemalloc`` or ``benchmarkclusters
+        --trace-memory``), since tracing slows down allocations. It is None
+        otherwise. tracemalloc also counts allocations of other threads and
+        stages must not be nested.
+    """
+
+    def __init__(self, prefix="[clusters]"):
+        self.prefix = prefix
+        self.stages = []
+        self.data = {}
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    @property
+    def time(self):
+        """
+        Total time spent in all stages, in seconds.
+        """
+        return sum(stage["time"] for stage in self.stages)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Context manager that records the time spent in the block and its
+        memory usage, and emits a log record with them.
+        """
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            start_memory, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        start_peak = peak_memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            growth = None if start_peak is None else peak_memory() - start_peak
+            memory = None
+            if tracing:
+                memory = tracemalloc.get_traced_memory()[1] - start_memory
+            self.stages.append(
+                {
+                    "name": name,
+                    "time": elapsed,
+                    "memory_growth": growth,
+                    "peak_memory": memory,
+                }
+            )
+            memory_msg = "" if memory is None else f", peak memory: {memory >> 20}MiB"
+            growth_msg = "" if growth is None else f", memory growth: {growth >> 20}MiB"
+            log.info(
+                f"{self.prefix} {name}: {elapsed:.3f}s{memory_msg}{growth_msg}",
+                extra={
+                    "stage": name,
+                    "duration": elapsed,
+                    "memory_growth": growth,
+                    "peak_memory": memory,
+                },
+            )
+
+    def to_json(self):
+        """
+        Return a JSON-compatible dictionary with the collected statistics.
+
+        The top level "peak_memory" is the peak resident memory of the process
+        (see :func:`peak_memory`), not of the clusterization.
+        """
+        return {
+            "time": self.time,
+            "peak_memory": peak_memory(),
+            "stages": [dict(stage) for stage in self.stages],
+            **self.data,
+        }
+
+
 def cluster_shapes(clusterization, clusters=None, user=None):
     """
     Return a list of cluster shapes from given clusterization object.
@@ -41,13 +288,17 @@ def cluster_shapes(clusterization, clusters=None, user=None):
             A clusterization instance
         clusters (queryset):
             Optional sequence of clusters. Use all clusters in clusterization
-            if not given.
+            if not given, in which case the affinities are cached until the
+            next clusterization.
         user (User):
             Optional user instance. If given, highlight all clusters the user
             belongs to.
     """
-    clusters = clusterization.clusters if clusters is None else clusters
-    shapes = compute_cluster_affinities(clusters.votes_table("mean"))
+    if clusters is None:
+        clusters = clusterization.clusters
+        shapes = clusterization.cluster_affinities()
+    else:
+        shapes = compute_cluster_affinities(clusters.votes_table("mean"))
     ids = list(shapes.keys())
     names = {c.id: c.name for c in clusters}
 
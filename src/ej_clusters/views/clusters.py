@@ -10,6 +10,7 @@ from django.views.generic import ListView, TemplateView
 from django.views.generic.edit import UpdateView
 from ej.decorators import can_edit_conversation
 from ej_clusters.models.clusterization import Clusterization
+from ej_clusters.scheduler import request_update
 from ej_conversations.models import Conversation
 from ej_conversations.utils import check_promoted
 from ej_dataviz.utils import get_dashboard_biggest_cluster
@@ -32,7 +33,9 @@ class ClustersIndexView(ListView):
         check_promoted(conversation, self.request)
         user = self.request.user
         clusterization = self.get_queryset()
-        clusterization.update_clusterization(force=True)
+
+        # Clusters are updated in background; render the last clusterization
+        request_update(clusterization)
         biggest_cluster_data = get_dashboard_biggest_cluster(
             self.request, conversation, clusterization
         )
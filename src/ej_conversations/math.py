@@ -3,6 +3,8 @@ from numbers import Number
 from sidekick import import_later
 
 pd = import_later("pandas")
+np = import_later("numpy")
+sparse = import_later("scipy.sparse")
 
 
 # ==============================================================================
@@ -172,3 +174,88 @@ def imputation(data, method, keep_empty=True):
     if not keep_empty:
         data.dropna("columns", inplace=True)
     return data
+
+
+def sparse_votes_matrix(authors, comments, choices, dtype=float):
+    """
+    Create a sparse (authors x comments) vote matrix from the given arrays of
+    author ids, comment ids and choices.
+
+    Since choices are -1, 0 or 1, dtype can be as small as int8.
+
+    Returns:
+        A tuple (matrix, authors, comments) with a CSR matrix and the sorted
+        arrays of unique author and comment ids associated with its rows and
+        columns. Every vote is an explicit entry of the matrix, even if its
+        value is zero (i.e., a skip).
+    """
+    authors, rows = np.unique(authors, return_inverse=True)
+    comments, cols = np.unique(comments, return_inverse=True)
+    matrix = sparse.coo_matrix(
+        (np.asarray(choices, dtype=dtype), (rows, cols)),
+        shape=(len(authors), len(comments)),
+    )
+    return matrix.tocsr(), authors, comments
+
+
+def dense_votes_matrix(authors, comments, choices):
+    """
+    Like :func:`sparse_votes_matrix`, but return a dense int8 matrix of choices
+    and a boolean mask of missing votes, which uses 2 bytes per entry instead
+    of the 8 bytes of a float64 table with NaNs.
+
+    Returns:
+        A tuple (votes, missing, authors, comments). Missing entries of the
+        votes matrix are zero.
+    """
+    authors, rows = np.unique(authors, return_inverse=True)
+    comments, cols = np.unique(comments, return_inverse=True)
+    votes = np.zeros((len(authors), len(comments)), dtype=np.int8)
+    missing = np.ones(votes.shape, dtype=bool)
+    votes[rows, cols] = choices
+    missing[rows, cols] = False
+    return votes, missing, authors, comments
+
+
+def masked_column_means(votes, missing):
+    """
+    Return the mean of each column of a votes matrix ignoring the entries
+    marked as missing. Columns without votes have a NaN mean.
+    """
+    counts = votes.shape[0] - missing.sum(axis=0)
+    totals = np.where(missing, 0, votes).sum(axis=0, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return totals / counts
+
+
+def sparse_from_dense(data, dtype=float):
+    """
+    Convert a dense array with NaN for missing data into a sparse matrix
+    compatible with :func:`sparse_votes_matrix`. All finite values, including
+    zeros, become explicit entries.
+    """
+    data = np.asarray(data, dtype=dtype)
+    rows, cols = np.nonzero(np.isfinite(data))
+    matrix = sparse.coo_matrix((data[rows, cols], (rows, cols)), shape=data.shape)
+    return matrix.tocsr()
+
+
+def sparse_column_stats(matrix):
+    """
+    Return the (mean, std) arrays of each column of a sparse vote matrix as
+    if missing entries were filled with the mean of the column.
+
+    Mean is computed from stored entries only. Since mean-imputed entries do
+    not deviate from the mean, data can be standardized by transforming the
+    stored entries alone, which keeps the matrix sparse.
+    """
+    matrix = sparse.csc_matrix(matrix)
+    n_rows, n_cols = matrix.shape
+    counts = np.diff(matrix.indptr)
+    cols = np.repeat(np.arange(n_cols), counts)
+    mean = np.bincount(cols, matrix.data, minlength=n_cols) / np.maximum(counts, 1)
+
+    deviations = matrix.data - mean[cols]
+    sq_sums = np.bincount(cols, deviations * deviations, minlength=n_cols)
+    std = np.sqrt(sq_sums / max(n_rows, 1))
+    return mean, std
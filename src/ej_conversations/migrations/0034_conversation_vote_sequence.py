@@ -0,0 +1,29 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_votes(apps, schema_editor):
+    Conversation = apps.get_model("ej_conversations", "Conversation")
+    conversations = Conversation.objects.annotate(n_votes=Count("comments__votes"))
+    for id, n_votes in conversations.filter(n_votes__gt=0).values_list("id", "n_votes"):
+        Conversation.objects.filter(id=id).update(vote_sequence=n_votes)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ej_conversations", "0033_conversation_participants_can_add_comments"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversation",
+            name="vote_sequence",
+            field=models.BigIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of votes cast in the conversation. It never decreases.",
+            ),
+        ),
+        migrations.RunPython(count_votes, migrations.RunPython.noop),
+    ]
@@ -123,6 +123,11 @@ class Conversation(HasFavoriteMixin, CustomizeMenuMixin, TimeStampedModel):
         default=True,
         help_text=_("Participants will be able to add comments to this conversation."),
     )
+    vote_sequence = models.BigIntegerField(
+        default=0,
+        editable=False,
+        help_text=_("Number of votes cast in the conversation. It never decreases."),
+    )
 
     objects = ConversationQuerySet.as_manager()
     tags = TaggableManager(through="ConversationTag", blank=True)
@@ -266,8 +271,16 @@ class Conversation(HasFavoriteMixin, CustomizeMenuMixin, TimeStampedModel):
         self.request = request
 
     def save(self, *args, **kwargs):
-        if self.id is None:
-            pass
+        # The vote sequence is only changed by atomic increments when votes
+        # are saved. Do not overwrite it with a possibly stale value.
+        if not (args or self._state.adding or kwargs.get("force_insert")) and (
+            kwargs.get("update_fields") is None
+        ):
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "vote_sequence"
+            ]
         super().save(*args, **kwargs)
 
     def clean(self):
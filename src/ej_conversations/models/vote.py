@@ -4,7 +4,7 @@ from django.utils.translation import gettext_lazy as _
 
 from boogie import models
 from boogie.fields import EnumField
-from .vote_queryset import VoteQuerySet
+from .vote_queryset import VoteQuerySet, increment_vote_sequence
 from ..enums import Choice
 
 VOTE_ERROR_MESSAGE = _("vote should be one of 'agree', 'disagree' or 'skip', got {value}")
@@ -64,6 +64,10 @@ class Vote(models.Model):
         comment = truncate(self.comment.content, 40)
         return f"{self.author} - {self.choice.name} ({comment})"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        increment_vote_sequence([(self.comment.conversation_id, 1)])
+
     def clean(self, *args, **kwargs):
         if self.comment.is_pending:
             msg = _("non-moderated comments cannot receive votes")
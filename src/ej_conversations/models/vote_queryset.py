@@ -1,7 +1,12 @@
+from collections import Counter
 from numbers import Number
 
-from boogie.models import QuerySet
-from ..math import imputation
+from boogie.models import F, QuerySet
+from sidekick import import_later
+
+from ..math import dense_votes_matrix, imputation, sparse_votes_matrix
+
+np = import_later("numpy")
 
 
 class VoteQuerySet(QuerySet):
@@ -11,6 +16,17 @@ class VoteQuerySet(QuerySet):
 
     votes = lambda self: self
 
+    def bulk_create(self, objs, *args, **kwargs):
+        from .comment import Comment
+
+        objs = super().bulk_create(objs, *args, **kwargs)
+        comments = Comment.objects.filter(id__in={vote.comment_id for vote in objs})
+        conversations = dict(comments.values_list("id", "conversation_id"))
+        increment_vote_sequence(
+            Counter(conversations[vote.comment_id] for vote in objs).items()
+        )
+        return objs
+
     def dataframe(self, *fields, index=None, verbose=False):
         if not fields:
             fields = ("author", "comment", "choice")
@@ -43,3 +59,59 @@ class VoteQuerySet(QuerySet):
         else:
             data = self.pivot_table("author", "comment", "choice")
             return imputation(data, data_imputation)
+
+    def votes_matrix(self, dtype=float):
+        """
+        Like :meth:`votes_table`, but return a sparse matrix built directly
+        from the (author, comment, choice) rows, without a pandas pivot.
+
+        Each vote is stored as an explicit entry of the matrix, including skip
+        votes, which are stored as explicit zeros. Missing votes are the
+        entries that are not stored.
+
+        Args:
+            dtype:
+                Type of the stored entries. Use int8 to save memory.
+
+        Returns:
+            A tuple (matrix, authors, comments) with a (authors x comments) CSR
+            matrix and two arrays with the author and comment ids corresponding
+            to each row and column.
+        """
+        data = self._votes_array()
+        return sparse_votes_matrix(data[:, 0], data[:, 1], data[:, 2], dtype=dtype)
+
+    def votes_array(self):
+        """
+        Like :meth:`votes_matrix`, but return a dense int8 matrix of choices
+        and a separate boolean mask of missing votes.
+
+        Returns:
+            A tuple (votes, missing, authors, comments) with the votes and mask
+            arrays of (authors x comments) and two arrays with the author and
+            comment ids corresponding to each row and column.
+        """
+        data = self._votes_array()
+        return dense_votes_matrix(data[:, 0], data[:, 1], data[:, 2])
+
+    def _votes_array(self):
+        rows = self.values_list("author_id", "comment_id", "choice")
+        return np.fromiter(
+            (x for row in rows.iterator() for x in row), dtype="int64"
+        ).reshape(-1, 3)
+
+
+def increment_vote_sequence(counts):
+    """
+    Increment the vote sequence of conversations.
+
+    Args:
+        counts:
+            Sequence of (conversation id, number of votes) pairs.
+    """
+    from .conversation import Conversation
+
+    for conversation_id, n_votes in counts:
+        Conversation.objects.filter(id=conversation_id).update(
+            vote_sequence=F("vote_sequence") + n_votes
+        )
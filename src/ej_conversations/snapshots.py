@@ -0,0 +1,230 @@
+"""
+Memory-mapped snapshots of the vote matrix of conversations.
+
+A snapshot stores the matrix returned by :meth:`VoteQuerySet.votes_array` for
+the votes in approved comments of a conversation as .npy files in
+``settings.EJ_VOTE_SNAPSHOTS_DIR``. Files are opened with numpy's mmap_mode,
+hence all processes that read the same snapshot share a single copy of it in
+the page cache of the operating system.
+
+Snapshots are versioned by the vote sequence of the conversation and by the
+set of approved comments. A new version is written when votes are cast or
+comments are moderated. Votes removed from the database are only reflected
+after the next vote. Older versions are kept for ``GRACE_TIME`` seconds, so
+processes that are about to open them are not affected by new writes.
+Whenever a snapshot cannot be written or read, the matrix is computed from
+the database.
+"""
+import os
+import shutil
+import time
+import uuid
+import zlib
+from logging import getLogger
+from pathlib import Path
+
+from django.conf import settings
+from sidekick import import_later
+
+np = import_later("numpy")
+pd = import_later("pandas")
+log = getLogger("ej")
+
+FILES = ("votes", "missing", "authors", "comments")
+GRACE_TIME = 60
+_open_snapshots = {}
+
+
+class VoteSnapshot:
+    """
+    Read-only (authors x comments) vote matrix of a conversation.
+
+    Attributes:
+        votes:
+            int8 matrix of choices. Missing votes are zero.
+        missing:
+            Boolean matrix that is True for missing votes.
+        authors, comments:
+            Arrays with the author and comment ids of each row and column.
+        version:
+            Version of the conversation data stored in the snapshot.
+    """
+
+    def __init__(self, path, version=None):
+        self.path = Path(path)
+        self.version = version
+        for name in FILES:
+            setattr(self, name, np.load(self.path / f"{name}.npy", mmap_mode="r"))
+
+    def __repr__(self):
+        return f"VoteSnapshot({str(self.path)!r})"
+
+    def votes_array(self):
+        """
+        Return a (votes, missing, authors, comments) tuple compatible with
+        :meth:`VoteQuerySet.votes_array`. Arrays are not copied.
+        """
+        return self.votes, self.missing, self.authors, self.comments
+
+    def votes_table(self, data_imputation=None):
+        """
+        Return a float dataframe like :meth:`VoteQuerySet.votes_table`.
+
+        Unlike the other methods, this creates a private copy of the data.
+        """
+        from .math import imputation
+
+        data = np.where(self.missing, np.nan, self.votes)
+        table = pd.DataFrame(
+            data,
+            index=pd.Index(self.authors, name="author"),
+            columns=pd.Index(self.comments, name="comment"),
+        )
+        return imputation(table, data_imputation)
+
+
+def snapshots_dir():
+    """
+    Return the directory in which snapshots are stored, or None if snapshots
+    are disabled.
+    """
+    path = getattr(settings, "EJ_VOTE_SNAPSHOTS_DIR", None)
+    return Path(path) if path else None
+
+
+def snapshot_version(conversation):
+    """
+    Return a string that changes whenever the votes in approved comments of
+    the conversation may have changed.
+    """
+    from .models import Comment, Conversation
+
+    sequence = (
+        Conversation.objects.filter(id=conversation.id)
+        .values_list("vote_sequence", flat=True)
+        .first()
+    )
+    comments = Comment.objects.filter(
+        conversation_id=conversation.id, status=Comment.STATUS.approved
+    ).order_by("id")
+    comment_ids = np.array(list(comments.values_list("id", flat=True)), dtype=np.int64)
+    created = int(conversation.created.timestamp() * 1_000_000)
+    return f"{created}-{sequence or 0}-{zlib.crc32(comment_ids.tobytes()):08x}"
+
+
+def vote_snapshot(conversation, version=None):
+    """
+    Return the :class:`VoteSnapshot` with the current votes of the given
+    conversation, writing it if necessary. Return None if snapshots are
+    disabled or if the snapshot could not be written or read.
+    """
+    root = snapshots_dir()
+    if root is None:
+        return None
+
+    version = version or snapshot_version(conversation)
+    path = root / f"conversation-{conversation.id}" / version
+    snapshot = _open_snapshots.get(conversation.id)
+    if snapshot is not None and snapshot.path == path:
+        return snapshot
+
+    try:
+        if not path.exists():
+            write_snapshot(conversation, path)
+        snapshot = VoteSnapshot(path, version)
+    except OSError as exc:
+        log.warning(f"[conversations] could not load vote snapshot {path}: {exc}")
+        return None
+    _open_snapshots[conversation.id] = snapshot
+    return snapshot
+
+
+def write_snapshot(conversation, path):
+    """
+    Write the vote matrix of the conversation in the given directory.
+
+    Files are written in a temporary directory that is atomically renamed,
+    hence readers never see partial snapshots. Versions with a smaller vote
+    sequence are removed after the grace period; processes that still have
+    them open keep their mapping until they are closed.
+    """
+    from .models import Comment
+
+    path = Path(path)
+    votes = conversation.votes.filter(comment__status=Comment.STATUS.approved)
+    arrays = dict(zip(FILES, votes.votes_array()))
+
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+    tmp.mkdir(parents=True)
+    try:
+        for name, data in arrays.items():
+            np.save(tmp / f"{name}.npy", data)
+        os.rename(tmp, path)
+    except OSError:
+        # Another process wrote the same version first
+        if not path.exists():
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    remove_old_snapshots(path)
+    log.info(f"[conversations] vote snapshot written: {path}")
+    return path
+
+
+def remove_old_snapshots(path, grace_time=GRACE_TIME):
+    """
+    Remove snapshots that are older than the snapshot in the given path.
+
+    Only versions with a smaller vote sequence that were written more than
+    grace_time seconds ago are removed. Hence, a slow writer never removes a
+    newer snapshot written by another process.
+    """
+    sequence = _version_sequence(path.name)
+    deadline = time.time() - grace_time
+    for old in path.parent.iterdir():
+        if old.name.startswith(".") or _version_sequence(old.name) >= sequence:
+            continue
+        try:
+            if old.stat().st_mtime < deadline:
+                shutil.rmtree(old, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+
+
+def _version_sequence(version):
+    try:
+        return int(version.split("-")[1])
+    except (IndexError, ValueError):
+        return -1
+
+
+def votes_array(conversation):
+    """
+    Return the (votes, missing, authors, comments) arrays of votes in approved
+    comments of the conversation.
+
+    Arrays are read from the vote snapshot if snapshots are enabled, and
+    computed from the database otherwise.
+    """
+    from .models import Comment
+
+    snapshot = vote_snapshot(conversation)
+    if snapshot is not None:
+        return snapshot.votes_array()
+    votes = conversation.votes.filter(comment__status=Comment.STATUS.approved)
+    return votes.votes_array()
+
+
+def votes_table(conversation, data_imputation=None):
+    """
+    Like :func:`votes_array`, but return a dataframe like
+    :meth:`VoteQuerySet.votes_table`.
+    """
+    from .models import Comment
+
+    snapshot = vote_snapshot(conversation)
+    if snapshot is not None:
+        return snapshot.votes_table(data_imputation)
+    votes = conversation.votes.filter(comment__status=Comment.STATUS.approved)
+    return votes.votes_table(data_imputation)
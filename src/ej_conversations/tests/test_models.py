@@ -1,5 +1,5 @@
 from django.core.exceptions import ValidationError
-from ej_conversations import create_conversation
+from ej_conversations import create_conversation, snapshots
 from ej_conversations.enums import Choice, RejectionReason
 from ej_conversations.models import Vote
 from ej_conversations.mommy_recipes import ConversationRecipes
@@ -131,6 +131,99 @@ class TestVote:
         assert comment_db.n_votes == 2
         assert vote1.choice == vote2.choice
 
+    def test_votes_matrix_stores_skip_votes_as_explicit_entries(
+        self, comment_db, mk_user
+    ):
+        user1 = mk_user(email="user1@domain.com")
+        user2 = mk_user(email="user2@domain.com")
+        comment_db.vote(user1, "agree")
+        comment_db.vote(user2, "skip")
+
+        matrix, authors, comments = Vote.objects.all().votes_matrix()
+        assert list(authors) == sorted([user1.id, user2.id])
+        assert list(comments) == [comment_db.id]
+        assert matrix.nnz == 2
+        assert sorted(matrix.toarray()[:, 0]) == [0, 1]
+
+    def test_votes_array_uses_int8_votes_and_missing_mask(self, comment_db, mk_user):
+        user1 = mk_user(email="user1@domain.com")
+        user2 = mk_user(email="user2@domain.com")
+        other = comment_db.conversation.create_comment(
+            user1, "other comment", status="approved", check_limits=False
+        )
+        comment_db.vote(user1, "agree")
+        comment_db.vote(user2, "skip")
+        other.vote(user2, "disagree")
+
+        votes, missing, authors, comments = Vote.objects.all().votes_array()
+        assert votes.dtype == "int8"
+        assert list(authors) == sorted([user1.id, user2.id])
+        assert list(comments) == sorted([comment_db.id, other.id])
+        table = Vote.objects.all().votes_table()
+        assert (missing == table.isna().values).all()
+        assert (votes == table.fillna(0).values).all()
+
+    def test_vote_snapshot_is_versioned_by_votes(
+        self, comment_db, mk_user, settings, tmp_path
+    ):
+        settings.EJ_VOTE_SNAPSHOTS_DIR = str(tmp_path)
+        conversation = comment_db.conversation
+        comment_db.vote(mk_user(email="user1@domain.com"), "agree")
+
+        snapshot = snapshots.vote_snapshot(conversation)
+        assert snapshot is snapshots.vote_snapshot(conversation)
+        assert snapshot.votes.dtype == "int8"
+        assert list(snapshot.comments) == [comment_db.id]
+
+        comment_db.vote(mk_user(email="user2@domain.com"), "disagree")
+        new = snapshots.vote_snapshot(conversation)
+        assert new.version != snapshot.version
+        assert sorted(new.votes[:, 0]) == [-1, 1]
+        votes = Vote.objects.filter(comment__conversation=conversation).votes_table()
+        assert (snapshots.votes_table(conversation) == votes).all().all()
+
+        # Old versions are kept during the grace period and writers never
+        # remove newer versions
+        assert snapshot.path.exists()
+        snapshots.remove_old_snapshots(snapshot.path, grace_time=0)
+        assert new.path.exists()
+        snapshots.remove_old_snapshots(new.path, grace_time=0)
+        assert not snapshot.path.exists()
+
+    def test_vote_snapshot_falls_back_to_database(
+        self, comment_db, mk_user, settings, tmp_path, monkeypatch
+    ):
+        def write_snapshot(conversation, path):
+            raise OSError("no space left on device")
+
+        settings.EJ_VOTE_SNAPSHOTS_DIR = str(tmp_path)
+        monkeypatch.setattr(snapshots, "write_snapshot", write_snapshot)
+        conversation = comment_db.conversation
+        comment_db.vote(mk_user(email="user1@domain.com"), "agree")
+
+        assert snapshots.vote_snapshot(conversation) is None
+        votes = Vote.objects.filter(comment__conversation=conversation).votes_table()
+        assert (snapshots.votes_table(conversation) == votes).all().all()
+
+    def test_votes_increment_conversation_vote_sequence(self, comment_db, mk_user):
+        conversation = comment_db.conversation
+        comment_db.vote(mk_user(email="user1@domain.com"), "skip")
+        comment_db.vote(mk_user(email="user2@domain.com"), "agree")
+
+        # Saving a stale conversation instance must not reset the sequence
+        conversation.save()
+        conversation.refresh_from_db()
+        assert conversation.vote_sequence == 2
+
+    def test_bulk_votes_increment_conversation_vote_sequence(self, comment_db, mk_user):
+        conversation = comment_db.conversation
+        users = [mk_user(email=f"user{i}@domain.com") for i in range(3)]
+        Vote.objects.bulk_create(
+            [Vote(author=user, comment=comment_db, choice=Choice.AGREE) for user in users]
+        )
+        conversation.refresh_from_db()
+        assert conversation.vote_sequence == 3
+
     def test_user_can_add_comment(self, mk_conversation, mk_user):
         conversation = mk_conversation()
         mk_comment = conversation.create_comment
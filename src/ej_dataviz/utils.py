@@ -9,6 +9,8 @@ from django.utils.translation import gettext as __, gettext_lazy as _
 from sidekick import import_later
 
 from ej_clusters.models import Cluster, Clusterization
+from ej_clusters.scheduler import request_update
+from ej_clusters.utils import get_or_set
 from ej_conversations.utils import check_promoted
 from ej_conversations.models.conversation import Conversation
 
@@ -72,11 +74,12 @@ def get_cluster_or_404(cluster_id, conversation=None):
 
 def get_clusters(conversation):
     """
-    Returns conversation clusters
+    Returns conversation clusters and schedules a background update of the
+    clusterization.
     """
     clusterization = getattr(conversation, "clusterization", None)
     if clusterization:
-        clusterization.update_clusterization()
+        request_update(clusterization)
         clusters = clusterization.clusters.all()
     else:
         clusters = ()
@@ -375,13 +378,27 @@ def get_biggest_cluster_data(cluster, cluster_as_dataframe):
 
 
 def get_dashboard_biggest_cluster(request, conversation, clusterization):
-    biggest_cluster = get_biggest_cluster(clusterization)
-    if biggest_cluster:
-        biggest_cluster_df = comments_data_cluster(
-            request, conversation, None, biggest_cluster.id
-        )
-        return get_biggest_cluster_data(biggest_cluster, biggest_cluster_df)
-    return {}
+    """
+    Return data of the biggest cluster for the dashboard. The result is cached
+    until the next clusterization.
+    """
+
+    def compute():
+        biggest_cluster = get_biggest_cluster(clusterization)
+        if biggest_cluster:
+            biggest_cluster_df = comments_data_cluster(
+                request, conversation, None, biggest_cluster.id
+            )
+            return get_biggest_cluster_data(biggest_cluster, biggest_cluster_df)
+        return {}
+
+    instance = clusterization
+    if clusterization is not None and not isinstance(clusterization, Clusterization):
+        instance = clusterization.first()
+    if instance is None:
+        return compute()
+    key = instance.cache_key("biggest_cluster_data")
+    return get_or_set(key, compute, stats="biggest_cluster_data")
 
 
 def comments_data_cluster(request, conversation, fmt, cluster_id, **kwargs):
@@ -5,7 +5,6 @@ from logging import getLogger
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.http import JsonResponse
 from django.shortcuts import render
@@ -20,6 +19,8 @@ from sklearn.decomposition import PCA
 from ej.decorators import can_access_dataviz, can_view_report_details
 from ej_clusters.models.cluster import Cluster
 from ej_clusters.models.clusterization import Clusterization
+from ej_clusters.scheduler import request_update
+from ej_conversations import snapshots
 from ej_conversations.models import Conversation
 from ej_conversations.utils import check_promoted
 from ej_dataviz.models import ToolsLinksHelper
@@ -65,19 +66,13 @@ class ClusterDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         cluster = self.get_object()
-        cluster_relevant_agreed_comments = cache.get_or_set(
-            f"cluster_{cluster.id}_relevant_agreed_comments",
-            cluster.separate_comments()[0],
-        )
-        cluster_relevant_disagred_comments = cache.get_or_set(
-            f"cluster_{cluster.id}_relevant_disagred_comments",
-            cluster.separate_comments()[1],
-        )
+        separated_comments = cluster.clusterization.separated_comments()
+        agreed, disagreed = separated_comments.get(cluster.id, ([], []))
         conversation = cluster.conversation
         return {
             "cluster": cluster,
-            "cluster_relevant_agreed_comments": cluster_relevant_agreed_comments,
-            "cluster_relevant_disagred_comments": cluster_relevant_disagred_comments,
+            "cluster_relevant_agreed_comments": agreed,
+            "cluster_relevant_disagred_comments": disagreed,
             "conversation": conversation,
         }
 
@@ -134,17 +129,29 @@ def scatter_pca_json(request, conversation_id, **kwargs):
     kwargs = {}
     clusterization = getattr(conversation, "clusterization", None)
     if clusterization is not None:
-        clusterization.update_clusterization()
+        request_update(clusterization)
+
+    # Reuse the projection stored by the last clusterization, if available
+    model = getattr(clusterization, "model", None)
+    if model is not None and model.components is not None:
+        df = snapshots.votes_table(conversation)
+    else:
+        model = None
+        df = snapshots.votes_table(conversation, "mean")
 
-    df = conversation.votes.votes_table("mean")
     if df.shape[0] <= 3 or df.shape[1] <= 3:
         return JsonResponse(
             {"error": "InsufficientData", "message": _("Not enough data")}
         )
-    pca = PCA(2)
-    data = pca.fit_transform(df.values)
+
+    if model is not None:
+        transformer = lambda x: model.project(model.transform(x))  # noqa: E731
+    else:
+        pca = PCA(2).fit(df.values)
+        imputer = impute.SimpleImputer().fit(df.values)
+        transformer = lambda x: pca.transform(imputer.transform(x))  # noqa: E731
+    data = transformer(df)
     data = pd.DataFrame(data, index=df.index, columns=["x", "y"])
-    imputer = impute.SimpleImputer().fit(df.values)
 
     # Mark self, if found
     if request.user.id in data.index:
@@ -168,7 +175,7 @@ def scatter_pca_json(request, conversation_id, **kwargs):
             conversation,
             data,
             list(df.columns),
-            transformer=lambda x: pca.transform(imputer.transform(x)),
+            transformer=transformer,
             kwargs=kwargs,
         )
     )
@@ -298,11 +305,11 @@ def users_data(request, conversation_id, fmt, **kwargs):
     except AttributeError:
         pass
     else:
-        # Retrieve non empty clusters.
-        data = clusters.values_list("users__id", "name", "id")
-        data = filter(lambda x: x[0], data)
-        extra = pd.DataFrame(data, columns=["user", "cluster", "cluster_id"])
-        extra.index = extra.pop("user")
+        cluster_ids = clusters.cluster_map()
+        names = dict(clusters.values_list("id", "name"))
+        extra = pd.DataFrame(
+            {"cluster": cluster_ids.map(names), "cluster_id": cluster_ids}
+        )
         df[["cluster", "cluster_id"]] = extra
         df["cluster_id"] = df.cluster_id.fillna(-1).astype(int)
     return export_data(df, fmt, filename)